@@ -0,0 +1,182 @@
+#! /usr/bin/env python
+'''
+batch export of many SVG files with a process pool
+
+usage: BatchDrills.py [--exporter gcode|csv] [--outdir DIR] [--jobs N]
+                      [--summary FILE] INPUT... [exporter options]
+
+Each INPUT is an SVG file, a directory of SVG files, or a manifest listing
+one SVG per line. Any other --option=value is handed to every export
+unchanged, e.g. --unit=mm --flipy=true --stream=true (or --workers=2, for
+the G-code exporter's own tour sorting processes)
+'''
+
+import argparse
+import csv
+import glob
+import importlib
+import io
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# exporter -> (module, output filename option, output extension)
+EXPORTERS = {
+    'gcode': ('ExportGCodeDrills', 'filename', '.nc'),
+    'csv': ('ExportDrills', 'csvfile', '.csv'),
+}
+
+SUMMARY_FIELDS = ['file', 'status', 'holes', 'tools', 'seconds', 'output', 'message']
+
+
+def find_inputs(paths):
+    """Expand directories and manifests into a list of SVG files."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, '*.svg'))))
+        elif path.lower().endswith('.svg'):
+            files.append(path)
+        else:
+            # Manifest - one file per line, relative to the manifest, '#' comments
+            base = os.path.dirname(path)
+            with open(path) as manifest:
+                for line in manifest:
+                    line = line.strip()
+                    if line and not line.startswith('#'):
+                        files.append(os.path.join(base, line))
+    return files
+
+
+def new_result(svgfile, outfile):
+    return dict(file=svgfile, status='ok', holes=0, tools=0, seconds=0.0,
+        output=outfile, message='')
+
+
+def export_one(exporter, svgfile, outfile, options):
+    """
+    Run one exporter over one file, and return a summary row for it.
+    Never raises, so one bad file can't stop the rest of the batch.
+    """
+    module_name, out_option, _ = EXPORTERS[exporter]
+    result = new_result(svgfile, outfile)
+    messages = io.StringIO()
+    stderr = sys.stderr
+    start = time.perf_counter()
+    # The exporters report problems through inkex.utils.errormsg (stderr)
+    sys.stderr = messages
+    try:
+        module = importlib.import_module(module_name)
+        from inkex import SVG_PARSER
+        effect = module.DrillExport()
+        effect.run(options + [f"--{out_option}={outfile}", f"--output={os.devnull}", svgfile])
+        # inkex recovers what it can from a broken SVG, and only reports the errors
+        parse_errors = len(SVG_PARSER.error_log)
+        circle_groups = getattr(effect, 'circle_groups', {})
+        result['holes'] = sum(len(holes) for holes in circle_groups.values())
+        result['tools'] = len(circle_groups)
+        if getattr(effect.options, 'spottoolno', 0) and getattr(effect.options, 'spotzend', 0):
+            result['tools'] += 1
+        # The exporters list every file they write, once they get that far
+        stats = getattr(effect, 'stats', None)
+        written = [path for path in getattr(stats, 'outputs', []) if os.path.exists(path)]
+        if parse_errors:
+            result['status'] = 'failed'
+        elif not circle_groups:
+            result['status'] = 'empty'
+        elif not written:
+            # e.g. the options were rejected after the circles were found
+            result['status'] = 'failed'
+            messages.write(" Nothing was written.")
+    except (Exception, SystemExit) as err:
+        result['status'] = 'failed'
+        messages.write(f" {type(err).__name__}: {err}")
+    finally:
+        sys.stderr = stderr
+    result['seconds'] = round(time.perf_counter() - start, 3)
+    result['message'] = ' '.join(messages.getvalue().split())
+    return result
+
+
+def export_pool(jobs, workers):
+    """
+    Run export_one over every job with a process pool, and return the summary
+    rows in input order. A worker that dies takes the whole pool with it, and
+    the pool can't say whose file did it - so the files it was holding are
+    run again one at a time, and only the one that kills its worker fails.
+    """
+    results = [None] * len(jobs)
+    rerun = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(export_one, *job) for job in jobs]
+        for i, future in enumerate(futures):
+            try:
+                results[i] = future.result()
+            except BrokenProcessPool:
+                rerun.append(i)
+            except Exception as err:
+                results[i] = failed_result(jobs[i], err)
+    for i in rerun:
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            try:
+                results[i] = pool.submit(export_one, *jobs[i]).result()
+            except Exception as err:
+                results[i] = failed_result(jobs[i], err)
+    return results
+
+
+def failed_result(job, err):
+    """Summary row for a job whose worker didn't return one."""
+    (_, svgfile, outfile, _) = job
+    result = new_result(svgfile, outfile)
+    result['status'] = 'failed'
+    result['message'] = f"{type(err).__name__}: {err}"
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--exporter', choices=sorted(EXPORTERS), default='gcode',
+        help='gcode or csv')
+    parser.add_argument('--outdir', default='.',
+        help='directory for the exported files')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1,
+        help='files to export at once (1 to run everything in this process)')
+    parser.add_argument('--summary', default='batch_summary.csv',
+        help='per-file summary CSV')
+    parser.add_argument('inputs', nargs='+',
+        help='SVG files, directories of SVG files, or manifests')
+    args, options = parser.parse_known_args(argv)
+
+    files = find_inputs(args.inputs)
+    os.makedirs(args.outdir, exist_ok=True)
+    ext = EXPORTERS[args.exporter][2]
+    jobs = [(args.exporter, svgfile,
+        os.path.join(args.outdir, os.path.splitext(os.path.basename(svgfile))[0] + ext),
+        options) for svgfile in files]
+
+    start = time.perf_counter()
+    if args.jobs <= 1 or len(jobs) <= 1:
+        results = [export_one(*job) for job in jobs]
+    else:
+        results = export_pool(jobs, args.jobs)
+    elapsed = time.perf_counter() - start
+
+    with open(args.summary, "w", newline="") as summary:
+        writer = csv.DictWriter(summary, fieldnames=SUMMARY_FIELDS)
+        writer.writeheader()
+        writer.writerows(results)
+
+    failed = [r for r in results if r['status'] == 'failed']
+    holes = sum(r['holes'] for r in results)
+    print(f"{len(results)} files, {holes} holes, {len(failed)} failed, {elapsed:.2f}s "
+        f"- summary in {args.summary}")
+    for r in failed:
+        print(f"FAILED {r['file']}: {r['message']}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
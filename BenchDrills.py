@@ -0,0 +1,267 @@
+#! /usr/bin/env python
+'''
+benchmarks for the drill exporters, on generated documents
+
+usage: BenchDrills.py [--sizes 1000,10000,100000] [--shapes flat,nested,...]
+                      [--repeat N] [--unit in|mm] [--output FILE]
+                      [--compare OLD.json] [--keep DIR]
+                      [--ordering nearest|hilbert|serpentine]
+                      [--optimize SECONDS] [--optpasses N]
+
+Each shape is generated at each size, and every stage of an export is timed
+on its own: loading the SVG, walking the tree, process_circle, grouping,
+ordering the holes (as the exporter does, with the given ordering and tour
+improvement options) and writing the G-code. The streaming loader is
+timed as a whole. Results go to a JSON file; give an older one with
+--compare to see how each stage has changed.
+'''
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import inkex
+
+import ExportGCodeDrills
+from drillcore import DrillEffect
+from drillemit import GCodeEmitter
+from drillorder import ORDERINGS, order_tour
+
+SHAPES = ['flat', 'nested', 'transforms', 'diameters', 'clustered']
+
+STAGES = ['load', 'traversal', 'process_circle', 'grouping', 'ordering', 'emit', 'stream']
+
+# Page size of the generated documents, mm
+PAGE_W = 200
+PAGE_H = 280
+
+# Depth of the group chain in the 'nested' shape
+NEST_DEPTH = 200
+
+
+def layout(n, clustered, rng):
+    """n hole centres on the page, spread evenly or in tight clusters."""
+    if not clustered:
+        return [(rng.uniform(0, PAGE_W), rng.uniform(0, PAGE_H)) for _ in range(n)]
+    centres = [(rng.uniform(10, PAGE_W - 10), rng.uniform(10, PAGE_H - 10))
+        for _ in range(max(1, n // 500))]
+    points = []
+    for _ in range(n):
+        (x, y) = rng.choice(centres)
+        points.append((min(max(rng.gauss(x, 3.0), 0), PAGE_W),
+            min(max(rng.gauss(y, 3.0), 0), PAGE_H)))
+    return points
+
+
+def make_svg(path, n, shape, seed=1):
+    """Write a document with n circles, laid out as the named shape."""
+    rng = random.Random(seed)
+    points = layout(n, shape == 'clustered', rng)
+    if shape == 'diameters':
+        radii = [0.2 + 0.01 * i for i in range(200)]
+    else:
+        radii = [0.4, 0.5, 0.8, 1.5]
+
+    with open(path, 'w') as svg:
+        svg.write('<svg xmlns="http://www.w3.org/2000/svg" '
+            'xmlns:inkscape="http://www.inkscape.org/namespaces/inkscape" '
+            f'width="{PAGE_W}mm" height="{PAGE_H}mm" viewBox="0 0 {PAGE_W} {PAGE_H}">\n')
+        svg.write('<g inkscape:groupmode="layer" id="layer1">\n')
+        per_level = math.ceil(n / NEST_DEPTH)
+        depth = 0
+        for (i, (x, y)) in enumerate(points):
+            if shape == 'nested' and i % per_level == 0:
+                # Each level shifts the next a little, so every depth has its own transform
+                svg.write('<g transform="translate(0.001,0.001)">\n')
+                depth += 1
+            x -= 0.001 * depth
+            y -= 0.001 * depth
+            transform = ''
+            if shape == 'transforms':
+                # Rotated about its own centre: same hole, a different matrix every time
+                transform = f' transform="rotate({rng.uniform(0, 360):.3f},{x:.3f},{y:.3f})"'
+            svg.write(f'<circle id="c{i}" cx="{x:.3f}" cy="{y:.3f}" '
+                f'r="{rng.choice(radii):.2f}"{transform}/>\n')
+        svg.write('</g>\n' * depth)
+        svg.write('</g>\n</svg>\n')
+
+
+class StageTimer:
+    """Wall time of each stage, filled in by `with timer('stage'):` blocks."""
+
+    def __init__(self):
+        self.times = {}
+
+    @contextlib.contextmanager
+    def __call__(self, stage):
+        start = time.perf_counter()
+        yield
+        self.times[stage] = time.perf_counter() - start
+
+
+def bench_file(svgfile, unit, options=()):
+    """
+    Time each stage of a G-code export of one file, with any other
+    exporter options given. Returns (times, info).
+    """
+    timer = StageTimer()
+    args = [f"--unit={unit}", "--flipy=true"] + list(options) + [svgfile]
+
+    effect = ExportGCodeDrills.DrillExport()
+    with timer('load'):
+        effect.parse_arguments(args)
+        effect.load_raw()
+
+    # Walk the tree, just collecting the circles...
+    found = []
+    effect.prepare()
+    effect.process_circle = lambda circle, matrix: found.append((circle, matrix))
+    with timer('traversal'):
+        effect.find_circles(effect.document.getroot())
+
+    # ...then hand them to the real process_circle
+    with timer('process_circle'):
+        for (circle, matrix) in found:
+            DrillEffect.process_circle(effect, circle, matrix)
+
+    with timer('grouping'):
+        circle_groups = effect.group_circles()
+
+    opts = effect.options
+    with timer('ordering'):
+        plan = []
+        for (d, group) in circle_groups.items():
+            (path, _, _) = order_tour(group.xs, group.ys, 0, opts.optimize, opts.optpasses, opts.ordering)
+            plan.append((d, group.take(path)))
+
+    with timer('emit'):
+        out = GCodeEmitter(io.StringIO(), effect.coord_format)
+        for (d, group) in plan:
+            out.template(ExportGCodeDrills.gcode_drill_start, z_start=0, cycle="Drill",
+                z_end=-0.1, z_clear=0.25, z_feed=1, firstpos=out.xy(*group.point(0)),
+                g_drillcmd="G81", g_peck="", g_rpm=1, toolno=1)
+            out.position(*group.point(0))
+            out.moves(group.xs[1:].tolist(), group.ys[1:].tolist())
+            out.template(ExportGCodeDrills.gcode_drill_end, z_clear=0.25)
+        out.close()
+    info = dict(holes=circle_groups.hole_count(), groups=len(circle_groups),
+        gcode_bytes=out.written)
+    effect.file_io.close()
+    del found, effect
+
+    streamed = ExportGCodeDrills.DrillExport()
+    with timer('stream'):
+        streamed.parse_arguments(["--stream=true"] + args)
+        streamed.load_raw()
+        streamed.group_circles()
+    streamed.file_io.close()
+    return timer.times, info
+
+
+def revision():
+    """The git commit being measured, if this is a git checkout."""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+            text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(results, old_file):
+    """Print the change in each stage against an older results file."""
+    with open(old_file) as old:
+        old = json.load(old)
+    before = {(r['shape'], r['circles']): r['stages'] for r in old['results']}
+    print(f"\nchange vs {old_file} ({old.get('revision')}), new/old time:")
+    print(f"{'shape':<12}{'circles':>9}" + "".join(f"{s:>17}" for s in STAGES))
+    for r in results:
+        stages = before.get((r['shape'], r['circles']))
+        if stages is None:
+            continue
+        cells = []
+        for s in STAGES:
+            if stages.get(s):
+                cells.append(f"{r['stages'][s] / stages[s]:>16.2f}x")
+            else:
+                cells.append(f"{'-':>17}")
+        print(f"{r['shape']:<12}{r['circles']:>9}" + "".join(cells))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='1000,10000,100000',
+        help='comma separated circle counts (1000000 works, given the memory)')
+    parser.add_argument('--shapes', default=','.join(SHAPES),
+        help='comma separated, from: ' + ', '.join(SHAPES))
+    parser.add_argument('--repeat', type=int, default=1,
+        help='runs per file; the fastest time of each stage is kept')
+    parser.add_argument('--unit', default='in', help='mm or in')
+    parser.add_argument('--output', default='bench_results.json',
+        help='JSON results file')
+    parser.add_argument('--compare', help='older results file to compare against')
+    parser.add_argument('--keep', help='keep the generated SVGs in this directory')
+    parser.add_argument('--ordering', default='nearest', choices=sorted(ORDERINGS),
+        help='hole ordering, as in the exporter')
+    parser.add_argument('--optimize', type=float, default=0,
+        help='tour improvement time per tour, seconds, as in the exporter')
+    parser.add_argument('--optpasses', type=int, default=0,
+        help='tour improvement passes per tour, as in the exporter')
+    args = parser.parse_args(argv)
+    options = [f"--ordering={args.ordering}", f"--optimize={args.optimize}",
+        f"--optpasses={args.optpasses}"]
+
+    sizes = [int(s) for s in args.sizes.split(',')]
+    shapes = args.shapes.split(',')
+    for shape in shapes:
+        if shape not in SHAPES:
+            parser.error(f"unknown shape {shape}")
+    workdir = args.keep or tempfile.mkdtemp(prefix='drillbench')
+    os.makedirs(workdir, exist_ok=True)
+
+    results = []
+    try:
+        for shape in shapes:
+            for n in sizes:
+                svgfile = os.path.join(workdir, f"{shape}_{n}.svg")
+                if not os.path.exists(svgfile):
+                    make_svg(svgfile, n, shape)
+                best = {}
+                for _ in range(args.repeat):
+                    times, info = bench_file(svgfile, args.unit, options)
+                    for (stage, t) in times.items():
+                        best[stage] = min(t, best.get(stage, t))
+                total = sum(best[s] for s in STAGES if s != 'stream')
+                results.append(dict(shape=shape, circles=n, **info,
+                    stages={s: round(best[s], 6) for s in STAGES}, total=round(total, 6)))
+                print(f"{shape:<12}{n:>9} circles  {total:8.3f}s  " +
+                    "  ".join(f"{s} {best[s]:.3f}" for s in STAGES), flush=True)
+    finally:
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(args.output, 'w') as out:
+        json.dump(dict(revision=revision(), date=time.strftime('%Y-%m-%dT%H:%M:%S'),
+            python=platform.python_version(), numpy=np.__version__,
+            inkex=getattr(inkex, '__version__', None), unit=args.unit, ordering=args.ordering,
+            optimize=args.optimize, optpasses=args.optpasses,
+            results=results), out, indent=1)
+    print(f"results in {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
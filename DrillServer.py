@@ -0,0 +1,145 @@
+#! /usr/bin/env python
+'''
+long-lived export worker, so each export skips interpreter startup and imports
+
+usage: DrillServer.py [--socket PATH | --stdin]
+
+Both exporters are imported once, up front, and export jobs are then run
+one at a time. A job is one line of JSON, e.g.
+  {"exporter": "gcode", "args": ["--unit=mm", "--filename=board.nc", "board.svg"], "cwd": "/work"}
+and gets one line back:
+  {"status": 0, "messages": "...", "seconds": 0.12}
+
+By default jobs come over a Unix socket, one per connection. While it is
+running, ExportDrills.py and ExportGCodeDrills.py (and so the Inkscape
+extensions) hand their jobs to it through drillclient.py. With --stdin,
+jobs are read from stdin and replies written to stdout, for pipelines.
+'''
+
+import argparse
+import importlib
+import io
+import json
+import os
+import signal
+import socket
+import sys
+import time
+import traceback
+
+from BatchDrills import EXPORTERS
+from drillclient import SUPPORTED, connect, owned_socket, socket_path
+
+
+def run_job(job):
+    """Run one export job, and return its reply. Never raises."""
+    module_name = EXPORTERS[job.get('exporter', 'gcode')][0]
+    args = list(job.get('args', []))
+    if not any(arg.startswith('--output') for arg in args):
+        # Nothing may reach our stdout, as --stdin replies go there
+        args.append(f"--output={os.devnull}")
+    messages = io.StringIO()
+    (stdout, stderr, cwd) = (sys.stdout, sys.stderr, os.getcwd())
+    # The exporters report through inkex.utils.errormsg (stderr)
+    sys.stdout = sys.stderr = messages
+    status = 0
+    start = time.perf_counter()
+    try:
+        os.chdir(job.get('cwd') or cwd)
+        effect = importlib.import_module(module_name).DrillExport()
+        effect.run(args)
+    except SystemExit as err:
+        status = err.code if isinstance(err.code, int) else (0 if err.code is None else 1)
+    except Exception:
+        status = 1
+        messages.write(traceback.format_exc())
+    finally:
+        (sys.stdout, sys.stderr) = (stdout, stderr)
+        os.chdir(cwd)
+    return dict(status=status, messages=messages.getvalue(),
+        seconds=round(time.perf_counter() - start, 3))
+
+
+def reply_to(line):
+    try:
+        job = json.loads(line)
+        if not isinstance(job, dict) or job.get('exporter', 'gcode') not in EXPORTERS:
+            raise ValueError("expected {\"exporter\": \"gcode\" or \"csv\", \"args\": [...]}")
+    except ValueError as err:
+        return dict(status=2, messages=f"Bad job: {err}\n", seconds=0.0)
+    return run_job(job)
+
+
+def serve_stdin():
+    for line in sys.stdin:
+        if line.strip():
+            print(json.dumps(reply_to(line)), flush=True)
+
+
+def serve_socket(path):
+    if not SUPPORTED:
+        print("Unix sockets aren't available here - use --stdin", file=sys.stderr)
+        return 1
+    sock = connect(path)
+    if sock is not None:
+        sock.close()
+        print(f"A server is already running on {path}", file=sys.stderr)
+        return 1
+    if os.path.lexists(path):
+        if not owned_socket(path):
+            print(f"{path} is in the way, and isn't a socket of yours", file=sys.stderr)
+            return 1
+        # Left behind by a server that has stopped
+        os.unlink(path)
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+        # Only this user may connect, from the moment the socket exists
+        umask = os.umask(0o177)
+        try:
+            server.bind(path)
+        finally:
+            os.umask(umask)
+        server.listen()
+        print(f"Serving drill exports on {path}", file=sys.stderr, flush=True)
+        # Stop on kill as on Ctrl-C, so the socket is removed either way
+        signal.signal(signal.SIGTERM, signal.default_int_handler)
+        try:
+            while True:
+                (conn, _) = server.accept()
+                with conn, conn.makefile('rb') as stream:
+                    line = stream.readline()
+                    if not line.strip():
+                        # Just checking we are here, e.g. another server starting up
+                        continue
+                    reply = reply_to(line)
+                    try:
+                        conn.sendall((json.dumps(reply) + "\n").encode())
+                    except OSError:
+                        # The client stopped waiting; carry on with the next
+                        pass
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.unlink(path)
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--socket', default=socket_path(),
+        help='Unix socket to listen on (default $DRILL_SERVER, or one in $XDG_RUNTIME_DIR or else per user in the temp directory)')
+    parser.add_argument('--stdin', action='store_true',
+        help='read jobs from stdin and write replies to stdout instead')
+    args = parser.parse_args(argv)
+
+    # The work this server saves every job
+    for (module_name, _, _) in EXPORTERS.values():
+        importlib.import_module(module_name)
+
+    if args.stdin:
+        serve_stdin()
+        return 0
+    return serve_socket(args.socket)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,15 +4,30 @@ export drills in csv for using on a milling machine
 '''
 __version__ = "1.0" ### please report bugs, suggestions etc at https://github.com/bkgoodman/InkscapeDrills ###
 
-import os,sys,inkex,simplestyle,gettext,math
+import os,sys
+
+if __name__ == '__main__':
+    # Hand the job to a running DrillServer.py, if there is one, before paying for the imports below
+    from drillclient import forward
+    status = forward('csv', sys.argv[1:])
+    if status is not None:
+        sys.exit(status)
+
+import inkex
 import csv
-from copy import deepcopy
-from inkex import elements
+from drillcore import DrillEffect
+from drillformats import write_excellon, write_hole_table
 
-class DrillExport(inkex.Effect):
+# File writer and extension for each --format other than csv
+FORMATS = {
+    'excellon': (write_excellon, '.drl'),
+    'table': (write_hole_table, '.npy'),
+}
+
+class DrillExport(DrillEffect):
   def __init__(self):
       # Call the base class constructor.
-      inkex.Effect.__init__(self)
+      DrillEffect.__init__(self)
       # Define options
       self.arg_parser.add_argument('--csvfile',action='store',type=str,
         dest='csvfile',default='',help='output filename')
@@ -20,119 +35,76 @@ class DrillExport(inkex.Effect):
         dest='flipy',help='Machine Orientation')
       self.arg_parser.add_argument('--separatedrills',action='store',type=str,
         dest='separatedrills',help='Separate files for each drill size')
+      self.arg_parser.add_argument('--format',action='store',type=str,
+        dest='format',default='csv',help='csv, excellon (drill file) or table (binary .npy); all but csv are one file')
       self.arg_parser.add_argument('--unit',action='store',type=str,
         dest='unit',default='in',help='mm or in')
       self.arg_parser.add_argument('--scope',action='store',type=str,
         dest='scope',default='document',help='document, layer or selection')
-
-  def process_circle(self,circle):
-        cx = circle.get('cx',0)
-        cy = circle.get('cy',0)
-        r = circle.get('r',0)
-        cx_uu = self.svg.unittouu(f"{cx}{self.svg.unit}")
-        cy_uu = self.svg.unittouu(f"{cy}{self.svg.unit}")
-        r_uu = self.svg.unittouu(f"{r}{self.svg.unit}")
-        matrix = circle.composed_transform()
-        cx_abs, cy_abs = matrix.apply_to_point([cx_uu, cy_uu])
-
-        if self.flipy == 'true':
-            cy_abs = self.heightDoc - cy_abs
-
-        if self.unit == "mm":
-            cx_mm = self.svg.uutounit(cx_abs,'mm')
-            cy_mm = self.svg.uutounit(cy_abs,'mm')
-            r_mm = self.svg.uutounit(r_uu,'mm')
-            formatted_d = f"{r_mm * 2:.2f}"
-            formatted_cx = f"{cx_mm:.2f}"
-            formatted_cy = f"{cy_mm:.2f}"
-        else:
-            cx_in = self.svg.uutounit(cx_abs,'in')
-            cy_in = self.svg.uutounit(cy_abs,'in')
-            r_in = self.svg.uutounit(r_uu,'in')
-            formatted_d = f"{r_in * 2:.4f}"
-            formatted_cx = f"{cx_in:.4f}"
-            formatted_cy = f"{cy_in:.4f}"
-        return ({
-            "d": formatted_d,
-            "cx": formatted_cx,
-            "cy": formatted_cy,
-            })
-
-  def find_circles_recursively(self, root_node, circle_groups):
-        """
-        Recursively walks the SVG element tree to find all circle nodes.
-        """
-        # inkex.utils.errormsg(f"ROOT TAG {root_node.tag} vs {elements._polygons.Circle.tag}")
-        # The tag is checked against the specific Circle class tag
-        if isinstance(root_node, elements.Circle):
-            e = self.process_circle(root_node)
-            circle_groups.setdefault(e['d'], []).append(e)
-        
-        # Iterate over all children of the current node
-
-        for child in root_node:
-            # inkex.utils.errormsg(f"FIND node {child}")
-            self.find_circles_recursively(child, circle_groups)
+      self.arg_parser.add_argument('--stream',action='store',type=str,
+        dest='stream',default='false',help='Stream the SVG instead of loading it (command line, document scope only)')
+      self.arg_parser.add_argument('--tolerance',action='store',type=float,
+        dest='tolerance',default=0,help='Drill diameters this close together with one tool (zero to keep every size)')
+      self.arg_parser.add_argument('--tooltable',action='store',type=str,
+        dest='tooltable',default='',help='Available drill sizes, comma separated (empty for none)')
+      self.arg_parser.add_argument('--dedupe',action='store',type=float,
+        dest='dedupe',default=0,help='Remove holes this close to another one (zero for no check)')
+      self.arg_parser.add_argument('--stats',action='store',type=str,
+        dest='stats',default='false',help='Save job statistics next to the output, and summarize them')
 
   def effect(self):
     #log ("This is a test")
-    svg = self.document.getroot()
-    
-    ns_svg = inkex.NSS['svg']
-
-    doc_unit = self.svg.unit
-
-    # Get the attributes:
-    self.heightDoc = self.svg.unittouu(self.svg.get('height'))
-    self.widthDoc = self.svg.unittouu(self.svg.get('width'))
-
     fn = self.options.csvfile
-    self.unit = self.options.unit
-    self.flipy = self.options.flipy
     scope = self.options.scope
     separatedrills = self.options.separatedrills
-    
-    circle_groups = {}
 
+    if self.options.format != "csv" and self.options.format not in FORMATS:
+        inkex.utils.errormsg(f"Unknown format {self.options.format} (use csv, " + ", ".join(FORMATS) + ")")
+        return
 
-    if scope == "selection":
-        # The `self.svg.selection` property provides the currently selected elements.
-        for node in self.svg.selection.values():
-            self.find_circles_recursively(node, circle_groups)
-    elif scope == "layer":
-        # Get the currently active layer
-        current_layer = self.svg.get_current_layer()
-        if current_layer is not None:
-            self.find_circles_recursively(current_layer, circle_groups)
-    elif scope == "document":
-        # The root of the SVG document is `self.document`.
-        self.find_circles_recursively(self.document.getroot(), circle_groups)
+    if not self.find_in_scope(scope):
+        return
+    # Kept on the effect, so batch runs can report on it
+    self.circle_groups = circle_groups = self.group_circles()
     
     if (len(circle_groups) == 0):
         inkex.utils.errormsg("No circles found in the specified scope.")
     else:
-        if separatedrills == "true":
+        if self.options.format in FORMATS:
+            # Every diameter in one file, written in one go
+            (write, ext) = FORMATS[self.options.format]
+            base, old_ext = os.path.splitext(fn)
+            if old_ext.lower() in ("", ".csv"):
+                fn = base + ext
+            self.stats.outputs.append(fn)
+            with self.stats.stage('write'):
+                write(fn, circle_groups, self.unit)
+        elif separatedrills == "true":
             # One CSV per radius
-            for d, rows in circle_groups.items():
+            for d, group in circle_groups.items():
                 base,ext = os.path.splitext(fn)
                 if not ext:
                     ext = ".csv"
                 nfn = f"{base}_{d}{self.unit}{ext}"
-                with open(nfn, "w", newline="") as csvfile:
+                self.stats.outputs.append(nfn)
+                with open(nfn, "w", newline="") as csvfile, self.stats.stage('write'):
                     writer = csv.writer(csvfile)
                     writer.writerow(["X", "Y"])
-                    for row in rows:
-                        writer.writerow([row['cx'],row['cy']])
+                    for (x, y) in zip(group.xs.tolist(), group.ys.tolist()):
+                        writer.writerow([f"{x:{self.coord_format}}",f"{y:{self.coord_format}}"])
         else:
             # All circles in one CSV
-            with open(fn, "w", newline="") as csvfile:
+            self.stats.outputs.append(fn)
+            with open(fn, "w", newline="") as csvfile, self.stats.stage('write'):
                 writer = csv.writer(csvfile)
                 writer.writerow(["Diameter", "X", "Y"])
-                for rows in circle_groups.values():
-                    for row in rows:
-                        writer.writerow([row['d'], row['cx'],row['cy']])
+                for d, group in circle_groups.items():
+                    for (x, y) in zip(group.xs.tolist(), group.ys.tolist()):
+                        writer.writerow([d, f"{x:{self.coord_format}}",f"{y:{self.coord_format}}"])
+    self.report_stats(fn)
     return
 
-# Create effect instance and apply it.
-effect = DrillExport()
-effect.run()
+if __name__ == '__main__':
+    # Create effect instance and apply it.
+    effect = DrillExport()
+    effect.run()
@@ -4,10 +4,23 @@ export drills in gcode for using on a milling machine
 '''
 __version__ = "1.0" ### please report bugs, suggestions etc at https://github.com/bkgoodman/InkscapeDrills ###
 
-import os,sys,inkex,simplestyle,gettext,math
-import csv
-from copy import deepcopy
-from inkex import elements
+import os,sys
+
+if __name__ == '__main__':
+    # Hand the job to a running DrillServer.py, if there is one, before paying for the imports below
+    from drillclient import forward
+    status = forward('gcode', sys.argv[1:])
+    if status is not None:
+        sys.exit(status)
+
+import inkex,math
+from drillcore import DrillEffect, HoleGroup
+from drillemit import GCodeEmitter
+from drillorder import ORDERINGS, nearest_point, order_tour
+from drillcache import TourCache
+from drillestimate import CycleEstimate, summary as estimate_summary
+from drillpattern import hole_pattern
+import numpy as np
 
 
 gcode_header = """
@@ -59,60 +72,32 @@ M5 (Spindle OFF)
 G0 Z{z_clear} (Move to Clearence Height)
 """
 
+# How each dialect defines a pattern subprogram, ends it, and calls it.
+# LinuxCNC (ngc) subs must be defined before they are called, so they go
+# after the header; Fanuc style subprograms follow the main program.
+gcode_sub = {
+    'ngc': ("o{num} sub (Pattern of {holes} holes)\n", "o{num} endsub\n\n", "o{num} call\n"),
+    'fanuc': ("O{num} (Pattern of {holes} holes)\n", "M99\n\n", "M98 P{num}\n"),
+}
+
+# First subprogram number in each dialect
+gcode_sub_first = {'ngc': 100, 'fanuc': 1000}
+
+gcode_shift = "G52 {offset} (Shift to copy {copy})\n"
+
+gcode_unshift = "G52 {offset} (Clear shift)\n"
+
+# Fewer holes than this are ordered in-process, as starting workers would cost more
+PARALLEL_MIN_HOLES = 20000
+
 hole_list_like = """
 X1.0000 Y1.0000
 """
 
-def distance(a, b):
-    """Euclidean distance using cx/cy fields."""
-    return math.hypot(float(a["cx"]) - float(b["cx"]), float(a["cy"]) - float(b["cy"]))
-
-hole_index=1
-
-# For debug only
-def mark_hole(hole):
-    return
-    global hole_index
-    txt = inkex.TextElement()
-    txt.text = f"{hole_index}"          # the actual string
-
-    cx = float(hole.get('cx',0))
-    cy = float(hole.get('cy',0))
-    r = float(hole.get('r',0))
-    txt.set('x', str((cx+r)*29))
-    txt.set('y', str(cy*29))
-    txt.style = {
-        'font-size': '12px',
-        'fill': '#000000',
-        'text-anchor': 'start',      
-        'dominant-baseline': 'middle' # center align vertically
-    }
-    hole_index = hole_index+1
-    hole['circle'].getparent().add(txt)
-
-# Sort holes so drills happen near each other
-def nearest_neighbor(holes, start_index=0):
-    """Return a reordered list of hole dicts (visit order)."""
-    if not holes:
-        return []
-
-    unvisited = list(range(len(holes)))
-    path = [start_index]
-    unvisited.remove(start_index)
-
-    while unvisited:
-        last = path[-1]
-        next_idx = min(unvisited, key=lambda j: distance(holes[last], holes[j]))
-        path.append(next_idx)
-        unvisited.remove(next_idx)
-
-    # Return the holes in sorted visiting order
-    return [holes[i] for i in path]
-
-class DrillExport(inkex.Effect):
+class DrillExport(DrillEffect):
   def __init__(self):
       # Call the base class constructor.
-      inkex.Effect.__init__(self)
+      DrillEffect.__init__(self)
       # Define options
       self.arg_parser.add_argument('--filename',action='store',type=str,
         dest='filename',default='',help='output filename')
@@ -126,6 +111,14 @@ class DrillExport(inkex.Effect):
         dest='unit',default='in',help='mm or in')
       self.arg_parser.add_argument('--scope',action='store',type=str,
         dest='scope',default='document',help='document, layer or selection')
+      self.arg_parser.add_argument('--stream',action='store',type=str,
+        dest='stream',default='false',help='Stream the SVG instead of loading it (command line, document scope only)')
+      self.arg_parser.add_argument('--tolerance',action='store',type=float,
+        dest='tolerance',default=0,help='Drill diameters this close together with one tool (zero to keep every size)')
+      self.arg_parser.add_argument('--tooltable',action='store',type=str,
+        dest='tooltable',default='',help='Available drill sizes, comma separated (empty for none)')
+      self.arg_parser.add_argument('--dedupe',action='store',type=float,
+        dest='dedupe',default=0,help='Remove holes this close to another one (zero for no check)')
 
       # GCode parameters
       self.arg_parser.add_argument('--toolno',action='store',type=int,
@@ -147,92 +140,258 @@ class DrillExport(inkex.Effect):
       self.arg_parser.add_argument('--spotzend',action='store',type=float,
         dest='spotzend',default=0,help='Spot Tool depth (zero for no peck)')
 
-  def process_circle(self,circle):
-        cx = circle.get('cx',0)
-        cy = circle.get('cy',0)
-        r = circle.get('r',0)
-        cx_uu = self.svg.unittouu(f"{cx}{self.svg.unit}")
-        cy_uu = self.svg.unittouu(f"{cy}{self.svg.unit}")
-        r_uu = self.svg.unittouu(f"{r}{self.svg.unit}")
-        matrix = circle.composed_transform()
-        cx_abs, cy_abs = matrix.apply_to_point([cx_uu, cy_uu])
-
-        if self.flipy == 'true':
-            cy_abs = self.heightDoc - cy_abs
-
-        if self.unit == "mm":
-            cx_mm = self.svg.uutounit(cx_abs,'mm')
-            cy_mm = self.svg.uutounit(cy_abs,'mm')
-            r_mm = self.svg.uutounit(r_uu,'mm')
-            formatted_d = f"{r_mm * 2:.2f}"
-            formatted_cx = f"{cx_mm:.2f}"
-            formatted_cy = f"{cy_mm:.2f}"
-        else:
-            cx_in = self.svg.uutounit(cx_abs,'in')
-            cy_in = self.svg.uutounit(cy_abs,'in')
-            r_in = self.svg.uutounit(r_uu,'in')
-            formatted_d = f"{r_in * 2:.4f}"
-            formatted_cx = f"{cx_in:.4f}"
-            formatted_cy = f"{cy_in:.4f}"
-        return ({
-            "d": formatted_d,
-            "cx": formatted_cx,
-            "cy": formatted_cy,
-            "circle" : circle
-            })
+      # Output size
+      self.arg_parser.add_argument('--modal',action='store',type=str,
+        dest='modal',default='false',help='Leave out X/Y words that have not changed')
+      self.arg_parser.add_argument('--trimzeros',action='store',type=str,
+        dest='trimzeros',default='false',help='Trim trailing zeros from coordinates')
+
+      # Tour construction and improvement
+      self.arg_parser.add_argument('--ordering',action='store',type=str,
+        dest='ordering',default='nearest',help='Hole ordering: nearest (greedy), hilbert or serpentine (fast, for huge jobs)')
+      self.arg_parser.add_argument('--optimize',action='store',type=float,
+        dest='optimize',default=0,help='Tour improvement time per tour, seconds (zero for none)')
+      self.arg_parser.add_argument('--optpasses',action='store',type=int,
+        dest='optpasses',default=0,help='Tour improvement passes per tour (zero for no limit)')
+      self.arg_parser.add_argument('--workers',action='store',type=int,
+        dest='workers',default=1,help='Processes to sort tours in (zero for one per CPU)')
+      self.arg_parser.add_argument('--linktours',action='store',type=str,
+        dest='linktours',default='false',help='Sort each size on its own and join the tours end to end, so they can be sorted in parallel')
+      self.arg_parser.add_argument('--cache',action='store',type=str,
+        dest='cache',default='false',help='Reuse tours of unchanged drill sizes from the last export')
+      self.arg_parser.add_argument('--stats',action='store',type=str,
+        dest='stats',default='false',help='Save job statistics next to the output, and summarize them')
+      self.arg_parser.add_argument('--patterns',action='store',type=str,
+        dest='patterns',default='false',help='Drill repeated hole patterns with a subprogram')
+      self.arg_parser.add_argument('--dialect',action='store',type=str,
+        dest='dialect',default='ngc',help='Subprogram style: ngc (o-word sub/call) or fanuc (O/M98/M99)')
+
+      # Cycle time estimate
+      self.arg_parser.add_argument('--estimate',action='store',type=str,
+        dest='estimate',default='false',help='Estimate the machining time of the program')
+      self.arg_parser.add_argument('--rapidrate',action='store',type=float,
+        dest='rapidrate',default=0,help='Rapid rate, units per minute (zero for 200 in/min or 5080 mm/min)')
+      self.arg_parser.add_argument('--toolchangetime',action='store',type=float,
+        dest='toolchangetime',default=10,help='Seconds per tool change')
+      self.arg_parser.add_argument('--dwell',action='store',type=float,
+        dest='dwell',default=0,help='Seconds of dwell at the bottom of each hole')
+
+  def emitter(self, ncfile):
+        """A G-code emitter for one output file, set up from the options."""
+        return GCodeEmitter(ncfile, self.coord_format,
+                modal=self.options.modal == "true", trim=self.options.trimzeros == "true")
+
+  def close_emitter(self, out):
+        out.close()
+        self.gcode_size += out.written
+        self.gcode_saved += out.saved()
+
+  def estimate(self, path):
+        """Simulate a written program, and report how long it should take to run."""
+        if self.options.estimate != "true":
+            return
+        with open(path) as program:
+            estimate = CycleEstimate(self.options.rapidrate, self.options.toolchangetime,
+                    self.options.dwell).run(program)
+        self.stats.estimates[path] = estimate.report()
+        inkex.utils.errormsg(f"Estimated cycle time for {path}:\n" + estimate_summary(estimate))
 
-  def find_circles_recursively(self, root_node, circle_groups):
+  def find_pattern(self, group):
         """
-        Recursively walks the SVG element tree to find all circle nodes.
+        Look for copies of one hole pattern in a tour's holes. Returns the
+        group to drill (every hole, in the pattern's order, if one was found)
+        and the HolePattern, or None.
         """
-        # inkex.utils.errormsg(f"ROOT TAG {root_node.tag} vs {elements._polygons.Circle.tag}")
-        # The tag is checked against the specific Circle class tag
-        if isinstance(root_node, elements.Circle):
-            e = self.process_circle(root_node)
-            circle_groups.setdefault(e['d'], []).append(e)
-        
-        # Iterate over all children of the current node
-
-        for child in root_node:
-            # inkex.utils.errormsg(f"FIND node {child}")
-            self.find_circles_recursively(child, circle_groups)
-
-  def effect(self):
-    global hole_index
-
-    hole_index=1
-    #log ("This is a test")
-    svg = self.document.getroot()
-    
-    ns_svg = inkex.NSS['svg']
+        if self.options.patterns != "true" or group is None:
+            return group, None
+        pattern = hole_pattern(group, int(self.coord_format.strip('.f')),
+                self.options.optimize, self.options.optpasses, self.options.ordering)
+        if pattern is None:
+            return group, None
+        self.stats.patterns.append(dict(diameter=group.d, holes=len(group),
+            copies=len(pattern.offsets), pattern_holes=len(pattern.pattern)))
+        size = f"{group.d}{self.unit}" if group.d is not None else "spot drill"
+        inkex.utils.errormsg(f"Pattern: {len(group)} holes ({size}) drilled as "
+            f"{len(pattern.offsets)} copies of {len(pattern.pattern)}")
+        return pattern.holes(), pattern
+
+  def define_patterns(self, out, patterns):
+        """Write the subprograms of the patterns used in one file."""
+        (define, end, _) = gcode_sub[self.options.dialect]
+        for pattern in patterns:
+            out.template(define, num=pattern.number, holes=len(pattern.pattern))
+            # The first hole is drilled by whoever calls it
+            out.moves(pattern.pattern.xs[1:].tolist(), pattern.pattern.ys[1:].tolist())
+            out.template(end, num=pattern.number)
+
+  def drill_holes(self, out, group, pattern):
+        """
+        Every hole of a tour after the first, which the cycle start drills.
+        A pattern is drilled by calling its subprogram at each copy, with
+        the copy's offset applied by G52.
+        """
+        if pattern is None:
+            out.moves(group.xs[1:].tolist(), group.ys[1:].tolist())
+            return
+        (_, _, call) = gcode_sub[self.options.dialect]
+        first = pattern.pattern.point(0)
+        for (k, (x, y)) in enumerate(pattern.offsets.tolist()):
+            if k:
+                out.template(gcode_shift, offset=out.xy(x, y), copy=k + 1)
+                out.moves([first[0]], [first[1]])
+            out.template(call, num=pattern.number)
+        out.template(gcode_unshift, offset=out.xy(0, 0))
+
+  def number_patterns(self, patterns):
+        """The distinct patterns of a file's passes, numbered in order."""
+        used = []
+        for pattern in patterns:
+            if pattern is not None and all(pattern is not p for p in used):
+                pattern.number = gcode_sub_first[self.options.dialect] + len(used)
+                used.append(pattern)
+        return used
+
+  def order_holes(self, group, start_index=0):
+        """
+        Sort holes so drills happen near each other, then run the 2-opt/Or-opt
+        improvement pass if it is enabled.
+        """
+        return self.order_tours([(group, start_index)])[0]
 
-    doc_unit = self.svg.unit
+  def worker_count(self):
+        return self.options.workers if self.options.workers > 0 else (os.cpu_count() or 1)
 
-    # Get the attributes:
-    self.heightDoc = self.svg.unittouu(self.svg.get('height'))
-    self.widthDoc = self.svg.unittouu(self.svg.get('width'))
+  def order_tours(self, jobs):
+        """
+        Order several hole groups, each given as (group, start index), and
+        return the sorted groups in the same order. With the tour cache on, a
+        group that hasn't changed since the last export gets its old tour
+        back. The rest are ordered in a process pool if there are workers to
+        spare and enough holes to be worth starting them, or here if not;
+        either way the tours come out the same.
+        """
+        sorted_groups = [None] * len(jobs)
+        todo = []
+        for (k, (group, start_index)) in enumerate(jobs):
+            path = None
+            if not len(group):
+                path = []
+            elif self.cache is not None:
+                path = self.cache.get(group, start_index)
+            if path is None:
+                todo.append(k)
+            else:
+                sorted_groups[k] = group.take(path)
+
+        tasks = [(jobs[k][0].xs, jobs[k][0].ys, jobs[k][1], self.options.optimize, self.options.optpasses,
+                self.options.ordering) for k in todo]
+        holes = sum(len(jobs[k][0]) for k in todo)
+        workers = min(self.worker_count(), len(todo))
+        if workers > 1 and holes >= PARALLEL_MIN_HOLES:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                # map() hands the results back in task order
+                results = list(pool.map(order_tour, *zip(*tasks)))
+        else:
+            results = [order_tour(*task) for task in tasks]
+
+        for (k, (path, before, after)) in zip(todo, results):
+            (group, start_index) = jobs[k]
+            if before is not None:
+                self.rapid_before += before
+                self.rapid_after += after
+            if self.cache is not None:
+                self.cache.put(group, start_index, path)
+            sorted_groups[k] = group.take(path)
+        for group in sorted_groups:
+            self.tour_length += float(np.hypot(np.diff(group.xs), np.diff(group.ys)).sum())
+        return sorted_groups
+
+  def open_cache(self):
+        """The tour cache for this export, or None if it is turned off."""
+        if self.options.cache != "true":
+            return None
+        settings = dict(unit=self.unit, flipy=self.flipy, ordering=self.options.ordering,
+                optimize=self.options.optimize, optpasses=self.options.optpasses,
+                width=self.svg.get('width'), height=self.svg.get('height'),
+                viewbox=self.svg.get('viewBox'))
+        return TourCache(self.options.filename + ".drillcache", settings)
+
+  def order_groups(self, circle_groups, last_pos=None):
+        """
+        Choose the order to drill the diameter groups in, and sort each one.
+        Each group is started at its hole nearest to where the previous tour
+        ended (last_pos), and the group with the closest such hole goes next.
+        Returns a list of (diameter, sorted hole group).
+        """
+        remaining = list(circle_groups.keys())
+        plan = []
+        while remaining:
+            if last_pos is None:
+                d, start = remaining[0], 0
+            else:
+                (x, y) = last_pos
+                best = None
+                for d in remaining:
+                    group = circle_groups[d]
+                    i = nearest_point(group.xs, group.ys, x, y)
+                    (hx, hy) = group.point(i)
+                    dist = math.hypot(hx - x, hy - y)
+                    if best is None or dist < best[0]:
+                        best = (dist, d, i)
+                (_, d, start) = best
+            remaining.remove(d)
+            group = self.order_holes(circle_groups[d], start) # Sort
+            plan.append((d, group))
+            last_pos = group.point(-1)
+        return plan
+
+  def link_tours(self, tours, last_pos=None):
+        """
+        Choose the order to drill already sorted (diameter, group) tours in.
+        Each one can be drilled forwards or backwards; the tour with an end
+        closest to where the previous one finished (last_pos) goes next,
+        starting from that end. Returns a list of (diameter, hole group).
+        """
+        remaining = list(tours)
+        plan = []
+        while remaining:
+            if last_pos is None:
+                (k, reverse) = (0, False)
+            else:
+                (x, y) = last_pos
+                best = None
+                for (k, (d, group)) in enumerate(remaining):
+                    for reverse in (False, True):
+                        (hx, hy) = group.point(-1 if reverse else 0)
+                        dist = math.hypot(hx - x, hy - y)
+                        if best is None or dist < best[0]:
+                            best = (dist, k, reverse)
+                (_, k, reverse) = best
+            (d, group) = remaining.pop(k)
+            if reverse:
+                group = group.take(np.arange(len(group) - 1, -1, -1))
+            plan.append((d, group))
+            last_pos = group.point(-1)
+        return plan
 
+  def effect(self):
+    self.rapid_before = 0.0
+    self.rapid_after = 0.0
+    self.tour_length = 0.0
+    self.gcode_size = 0
+    self.gcode_saved = 0
+    self.cache = None
+    #log ("This is a test")
     fn = self.options.filename
-    self.unit = self.options.unit
-    self.flipy = self.options.flipy
     scope = self.options.scope
     separatedrills = self.options.separatedrills
-    
-    circle_groups = {}
-
-
-    if scope == "selection":
-        # The `self.svg.selection` property provides the currently selected elements.
-        for node in self.svg.selection.values():
-            self.find_circles_recursively(node, circle_groups)
-    elif scope == "layer":
-        # Get the currently active layer
-        current_layer = self.svg.get_current_layer()
-        if current_layer is not None:
-            self.find_circles_recursively(current_layer, circle_groups)
-    elif scope == "document":
-        # The root of the SVG document is `self.document`.
-        self.find_circles_recursively(self.document.getroot(), circle_groups)
+
+    if not self.find_in_scope(scope):
+        return
+    # Kept on the effect, so batch runs can report on it
+    self.circle_groups = circle_groups = self.group_circles()
+    self.cache = self.open_cache()
     
 
     if self.unit == "mm":
@@ -244,7 +403,7 @@ class DrillExport(inkex.Effect):
         g_peck = ""
         g_drillcmd = "G81"
     else:
-        g_peck = f"{self.options.peck:.4f}"
+        g_peck = f"Q{self.options.peck:.4f}"
         g_drillcmd = "G83"
     g_rpm = f"{int(self.options.rpm)}"
     toolno = self.options.toolno
@@ -280,6 +439,14 @@ class DrillExport(inkex.Effect):
         do_spot_drill = False
 
 
+    if self.options.ordering not in ORDERINGS:
+        inkex.utils.errormsg(f"Unknown hole ordering {self.options.ordering} (use " + ", ".join(ORDERINGS) + ")")
+        return
+
+    if self.options.dialect not in gcode_sub:
+        inkex.utils.errormsg(f"Unknown subprogram style {self.options.dialect} (use ngc or fanuc)")
+        return
+
     if (self.options.zclear <= self.options.zstart):
         inkex.utils.errormsg("Z-Clear must be ABOVE Z-Start")
         return
@@ -298,102 +465,153 @@ class DrillExport(inkex.Effect):
     else:
         if separatedrills == "true":
             # One CSV per radius
-            for d, hole_list in circle_groups.items():
-                hole_list = nearest_neighbor(hole_list) # Sort
+            with self.stats.stage('order'):
+                tours = self.order_tours([(group, 0) for group in circle_groups.values()]) # Sort
+                tours = [self.find_pattern(group) for group in tours]
+            for d, (group, pattern) in zip(circle_groups.keys(), tours):
                 base,ext = os.path.splitext(fn)
                 if not ext:
                     ext = ".csv"
                 nfn = f"{base}_{d}{self.unit}{ext}"
-                with open(nfn, "w", newline="") as ncfile:
-                    ncfile.write(f"(--- {base} - {d}{self.unit} - Tool # {toolno} ---)\n")
+                self.stats.outputs.append(nfn)
+                patterns = self.number_patterns([pattern])
+                with open(nfn, "w", newline="") as ncfile, self.stats.stage('write'):
+                    out = self.emitter(ncfile)
+                    out.write(f"(--- {base} - {d}{self.unit} - Tool # {toolno} ---)\n")
                     if do_spot_drill:
-                        ncfile.write(f"(Tool {self.options.spottoolno}  - Center/Spot drill)\n")
-                    ncfile.write(gcode_header.format(g_unit=g_unit))
+                        out.write(f"(Tool {self.options.spottoolno}  - Center/Spot drill)\n")
+                    out.template(gcode_header, g_unit=g_unit)
+                    if self.options.dialect != "fanuc":
+                        self.define_patterns(out, patterns)
                     for op in operations:
                         if op['spot']:
                             t = op['toolno']
-                            ncfile.write(f"(Tool {t}  - Spot Drill)\n")
+                            out.write(f"(Tool {t}  - Spot Drill)\n")
                         else:
                             t = toolno
-                            ncfile.write(f"(Tool {t}  - {d}{self.unit})\n")
-                        ncfile.write(gcode_drill_start.format(z_start=z_start,
+                            out.write(f"(Tool {t}  - {d}{self.unit})\n")
+                        if self.options.stats == "true":
+                            self.stats.add_tour(t, d if not op['spot'] else None, group)
+                        out.template(gcode_drill_start, z_start=z_start,
                             cycle=op['name'],
                             z_end=op['zend'],
                             z_clear=z_clear,
                             z_feed=z_feed,
-                            firstpos=f"X{hole_list[0]['cx']} Y{hole_list[0]['cy']}",
+                            firstpos=out.xy(*group.point(0)),
                             g_drillcmd=op['drillcmd'],
                             g_peck=op['peck'],
                             g_rpm=g_rpm,
-                            toolno=toolno))
-                        mark_hole(hole_list[0])
+                            toolno=toolno)
+                        out.position(*group.point(0))
 
                         # First hole done as part of "gcode_drill_start", above - skip it
-                        for hole in hole_list[1:]:
-                            ncfile.write(f"X{hole['cx']} Y{hole['cy']}\n")
-                            mark_hole(hole)
-
-                        ncfile.write(gcode_drill_end.format(z_clear=z_clear))
-                    ncfile.write(gcode_footer)
+                        self.drill_holes(out, group, pattern)
+
+                        out.template(gcode_drill_end, z_clear=z_clear)
+                    out.template(gcode_footer)
+                    if self.options.dialect == "fanuc":
+                        self.define_patterns(out, patterns)
+                    self.close_emitter(out)
+                self.estimate(nfn)
                 if (self.options.incrementtools == "true"):
                     toolno += 1
         else:
             # All circles in one CSV
-            diameters = circle_groups.keys()
-            with open(fn, "w", newline="") as ncfile:
-                ncfile.write(f"(--- {fn} - All Drills ---)\n")
+            # Spot drill every hole in one tour, whatever its diameter
+            spot_group = None
+            pos = None
+            with self.stats.stage('order'):
+                if self.options.linktours == "true":
+                    # Every tour is sorted on its own, so they can be done in parallel,
+                    # and then they are linked up end to end
+                    jobs = [(group, 0) for group in circle_groups.values()]
+                    if do_spot_drill:
+                        jobs.insert(0, (HoleGroup.concat(None, circle_groups.values()), 0))
+                    tours = self.order_tours(jobs) # Sort
+                    if do_spot_drill:
+                        spot_group = tours.pop(0)
+                        pos = spot_group.point(-1)
+                    plan = self.link_tours(list(zip(circle_groups.keys(), tours)), pos)
+                else:
+                    if do_spot_drill:
+                        spot_group = HoleGroup.concat(None, circle_groups.values())
+                        spot_group = self.order_holes(spot_group) # Sort
+                        pos = spot_group.point(-1)
+                    # Then each diameter, starting near where the last tool finished
+                    plan = self.order_groups(circle_groups, pos)
+                (spot_group, spot_pattern) = self.find_pattern(spot_group)
+                plan = [(d,) + self.find_pattern(group) for (d, group) in plan]
+            patterns = self.number_patterns([spot_pattern] + [pattern for (_, _, pattern) in plan])
+            self.stats.outputs.append(fn)
+            with open(fn, "w", newline="") as ncfile, self.stats.stage('write'):
+                out = self.emitter(ncfile)
+                out.write(f"(--- {fn} - All Drills ---)\n")
                 if do_spot_drill:
-                    ncfile.write(f"(--- Tool {self.options.spottoolno}  - Center/Spot drill ---)\n")
-                for (x,d) in enumerate(diameters):
-                    ncfile.write(f"(--- Tool {toolno+x}  - {d}{self.unit} ---)\n")
-                ncfile.write(gcode_header.format(g_unit=g_unit))
+                    out.write(f"(--- Tool {self.options.spottoolno}  - Center/Spot drill ---)\n")
+                for (x,(d,group,pattern)) in enumerate(plan):
+                    out.write(f"(--- Tool {toolno+x}  - {d}{self.unit} ---)\n")
+                out.template(gcode_header, g_unit=g_unit)
+                if self.options.dialect != "fanuc":
+                    self.define_patterns(out, patterns)
 
-                first_drill = False
                 for op in operations:
-                    for d in diameters:
-                        if op['spot']:
-                            t = op['toolno']
-                        else:
-                            t = toolno
-                            ncfile.write(f"(Tool {t}  - {d}{self.unit})\n")
-
-                        #ncfile.write(f"(Tool {t}  Operation {op['name']} - {d}{self.unit})\n")
-
-                        # Tool change only for new diameter, or FIRST spot diameter, only
-                        # (i.e. don't change for every different spot drill diameter
-
-                        hole_list = circle_groups[d]
-                        hole_list = nearest_neighbor(hole_list) # Sort
-                        if not op['spot'] or not first_drill:
-                            first_drill = True
-                            ncfile.write(gcode_drill_start.format(z_start=z_start,
-                                cycle=op['name'],
-                                z_end=op['zend'],
-                                z_clear=z_clear,
-                                z_feed=z_feed,
-                                g_drillcmd=op['drillcmd'],
-                                g_peck=op['peck'],
-                                firstpos=f"X{hole_list[0]['cx']} Y{hole_list[0]['cy']}",
-                                g_rpm=g_rpm,
-                                toolno=t))
-                            mark_hole(hole_list[0])
-                            # Remove first hole from list, because we're already doing it here
-                            hole_list = hole_list[1:]
-
-                        for hole in hole_list:
-                            ncfile.write(f"X{hole['cx']} Y{hole['cy']}\n")
-                            mark_hole(hole)
-                        # We'll end spot drills after ALL diameters done
+                    if op['spot']:
+                        # One tool change, and one cycle, for all spot holes
+                        passes = [(None, op['toolno'], spot_group, spot_pattern)]
+                    else:
+                        passes = [(d, None, group, pattern) for (d, group, pattern) in plan]
+                    for (d, t, group, pattern) in passes:
                         if not op['spot']:
-                            ncfile.write(gcode_drill_end.format(z_clear=z_clear))
+                            t = toolno
+                            out.write(f"(Tool {t}  - {d}{self.unit})\n")
+                        if self.options.stats == "true":
+                            self.stats.add_tour(t, d, group)
+
+                        out.template(gcode_drill_start, z_start=z_start,
+                            cycle=op['name'],
+                            z_end=op['zend'],
+                            z_clear=z_clear,
+                            z_feed=z_feed,
+                            g_drillcmd=op['drillcmd'],
+                            g_peck=op['peck'],
+                            firstpos=out.xy(*group.point(0)),
+                            g_rpm=g_rpm,
+                            toolno=t)
+                        out.position(*group.point(0))
+
+                        # First hole done as part of "gcode_drill_start", above - skip it
+                        self.drill_holes(out, group, pattern)
+                        out.template(gcode_drill_end, z_clear=z_clear)
                         if (self.options.incrementtools == "true") and not op['spot']:
                             toolno += 1
-                    # All diameters done - end, if we are doing spot drills
-                    if op['spot']:
-                        ncfile.write(gcode_drill_end.format(z_clear=z_clear))
-                ncfile.write(gcode_footer)
+                out.template(gcode_footer)
+                if self.options.dialect == "fanuc":
+                    self.define_patterns(out, patterns)
+                self.close_emitter(out)
+            self.estimate(fn)
+
+        if self.cache is not None:
+            self.cache.save()
+            inkex.utils.errormsg(f"Tour cache: {self.cache.hits} tours reused, "
+                f"{self.cache.misses} ordered again")
+        # Nothing to report if every tour came from the cache
+        if (self.options.optimize > 0 or self.options.optpasses > 0) and self.rapid_before:
+            saved = self.rapid_before - self.rapid_after
+            pct = 100.0 * saved / self.rapid_before if self.rapid_before else 0.0
+            inkex.utils.errormsg(f"Rapid travel: {self.rapid_before:.4f}{self.unit} before tour improvement, "
+                f"{self.rapid_after:.4f}{self.unit} after ({saved:.4f}{self.unit}, {pct:.1f}% saved)")
+        if self.options.ordering != "nearest":
+            inkex.utils.errormsg(f"Tour length with {self.options.ordering} ordering: "
+                f"{self.tour_length:.4f}{self.unit} (compare with ordering 'nearest')")
+        if self.options.modal == "true" or self.options.trimzeros == "true":
+            full = self.gcode_size + self.gcode_saved
+            pct = 100.0 * self.gcode_saved / full if full else 0.0
+            inkex.utils.errormsg(f"G-code size: {self.gcode_size} bytes, "
+                f"{self.gcode_saved} bytes ({pct:.1f}%) saved by shorter coordinates")
+    self.report_stats(fn)
     return
 
-# Create effect instance and apply it.
-effect = DrillExport()
-effect.run()
+if __name__ == '__main__':
+    # Create effect instance and apply it.
+    effect = DrillExport()
+    effect.run()
@@ -0,0 +1,67 @@
+'''
+sidecar cache of hole tours, for quick re-exports after small edits
+'''
+
+import hashlib
+import json
+import os
+import numpy as np
+
+# Bump when the ordering code changes what it would produce
+CACHE_VERSION = 1
+
+
+class TourCache:
+    """
+    Tours from the last export, kept in a JSON file next to the output.
+
+    A tour is looked up by a signature of the group's circle keys (see
+    drillconvert.circle_key), in document order, together with its start
+    hole and the export settings. Any edit to a circle in the group - its
+    id, position, size or any ancestor transform - changes the signature,
+    so only that group is ordered again. Unchanged groups reuse their
+    cached tour.
+    """
+
+    def __init__(self, path, settings):
+        self.path = path
+        self.settings = json.dumps(settings, sort_keys=True)
+        self.tours = {}
+        self.used = {}
+        self.hits = 0
+        self.misses = 0
+        try:
+            with open(path) as cachefile:
+                data = json.load(cachefile)
+        except (OSError, ValueError):
+            return
+        if data.get('version') == CACHE_VERSION and data.get('settings') == self.settings:
+            self.tours = data.get('tours', {})
+
+    def key(self, group, start_index):
+        digest = hashlib.sha1(self.settings.encode())
+        digest.update(f"|{start_index}|".encode())
+        digest.update(np.ascontiguousarray(group.keys, dtype=np.uint64).tobytes())
+        return digest.hexdigest()
+
+    def get(self, group, start_index):
+        """The cached visiting order for the group, or None."""
+        key = self.key(group, start_index)
+        path = self.tours.get(key)
+        if path is None or len(path) != len(group):
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.used[key] = path
+        return path
+
+    def put(self, group, start_index, path):
+        self.used[self.key(group, start_index)] = [int(i) for i in path]
+
+    def save(self):
+        """Write out the tours used in this run. Stale ones are dropped."""
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as cachefile:
+            json.dump(dict(version=CACHE_VERSION, settings=self.settings, tours=self.used),
+                cachefile, separators=(',', ':'))
+        os.replace(tmp, self.path)
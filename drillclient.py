@@ -0,0 +1,117 @@
+'''
+thin client for DrillServer.py, used by the exporters' entry points
+
+Only the standard library is imported here, so handing a job to a running
+server costs a fraction of loading inkex, lxml and numpy.
+'''
+
+import json
+import os
+import shutil
+import socket
+import stat
+import sys
+import tempfile
+
+# The server listens on a Unix socket, only trusted if this user owns it.
+# Without either (e.g. on Windows) every export is run locally.
+SUPPORTED = hasattr(socket, 'AF_UNIX') and hasattr(os, 'getuid')
+
+
+def socket_path():
+    """
+    The server's socket: $DRILL_SERVER, or one in the user's runtime
+    directory ($XDG_RUNTIME_DIR), or failing that one per user in the
+    temp directory.
+    """
+    if os.environ.get('DRILL_SERVER'):
+        return os.environ['DRILL_SERVER']
+    if os.environ.get('XDG_RUNTIME_DIR'):
+        return os.path.join(os.environ['XDG_RUNTIME_DIR'], "inkscape-drills.sock")
+    if not SUPPORTED:
+        return os.path.join(tempfile.gettempdir(), "inkscape-drills.sock")
+    return os.path.join(tempfile.gettempdir(), f"inkscape-drills-{os.getuid()}.sock")
+
+
+def owned_socket(path):
+    """
+    Whether path is a socket belonging to this user. Anyone can make a
+    file in the temp directory, and whoever listens on the socket gets
+    every job's paths and arguments.
+    """
+    if not SUPPORTED:
+        return False
+    try:
+        info = os.lstat(path)
+    except OSError:
+        return False
+    return stat.S_ISSOCK(info.st_mode) and info.st_uid == os.getuid()
+
+
+def connect(path=None):
+    """
+    A connection to the server, or None if there isn't one running (or
+    the socket isn't this user's).
+    """
+    path = path or socket_path()
+    if not owned_socket(path):
+        return None
+    try:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    except OSError:
+        return None
+    try:
+        sock.connect(path)
+    except OSError:
+        # Left behind by a server that has stopped
+        sock.close()
+        return None
+    return sock
+
+
+def request(sock, job):
+    """
+    Send one job, and wait for its reply. Returns None if the server
+    went away before it replied.
+    """
+    try:
+        with sock:
+            sock.sendall((json.dumps(job) + "\n").encode())
+            sock.shutdown(socket.SHUT_WR)
+            reply = json.loads(b"".join(iter(lambda: sock.recv(1 << 16), b"")))
+    except (OSError, ValueError):
+        return None
+    return reply if isinstance(reply, dict) else None
+
+
+def forward(exporter, argv):
+    """
+    Run an export on the server, as if this process had run it: messages
+    go to stderr and the document (unless --output names a file) to
+    stdout. Returns the exit status, or None if the export should be run
+    here instead: no server is running, or it stopped before replying.
+    Every export rewrites its files from scratch, so running it again here
+    is safe whatever the server got through.
+    """
+    sock = connect()
+    if sock is None:
+        return None
+    argv = list(argv)
+    document = None
+    if not any(arg.startswith('--output') for arg in argv):
+        # The server can't write to our stdout - have it write the document here
+        (fd, document) = tempfile.mkstemp(suffix='.svg')
+        os.close(fd)
+        argv.append(f"--output={document}")
+    try:
+        reply = request(sock, dict(exporter=exporter, args=argv, cwd=os.getcwd()))
+        if reply is None:
+            return None
+        sys.stderr.write(reply.get('messages', ''))
+        if document is not None:
+            with open(document, 'rb') as svg:
+                shutil.copyfileobj(svg, sys.stdout.buffer)
+    finally:
+        if document is not None:
+            os.unlink(document)
+    return reply.get('status', 1)
@@ -0,0 +1,110 @@
+'''
+batch coordinate and unit conversion for extracted circles
+'''
+
+import hashlib
+from array import array
+import numpy as np
+from inkex.units import CONVERSIONS
+
+
+def circle_key(ident, cx, cy, r, matrix_key):
+    """
+    Stable 64-bit hash of a circle's id, raw attributes and composed
+    transform, used to tell whether it changed between exports.
+    """
+    text = f"{ident}|{cx}|{cy}|{r}|{matrix_key!r}"
+    digest = hashlib.blake2b(text.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+class CircleBatch:
+    """
+    Raw cx/cy/r values of circles, collected during the tree walk and
+    converted to output units in one pass.
+
+    Circles sharing a composed transform are converted together, in the
+    same steps (and so with the same rounding) as converting each circle on
+    its own: the transform, then the Y flip, then the change of unit.
+    """
+
+    def __init__(self, svg, unit, flipy, height, keyed=False):
+        self.svg = svg
+        self.unit = unit
+        self.flipy = flipy
+        self.height = height
+        # Pixels per document unit
+        self.to_px = CONVERSIONS[svg.unit]
+        self.cx = array('d')
+        self.cy = array('d')
+        self.r = array('d')
+        # circle_key() of every circle, if asked for
+        self.keys = array('Q') if keyed else None
+        # Transform (as inkex keeps it, in complex form) -> rows using it
+        self.transforms = {}
+
+    def __len__(self):
+        return len(self.cx)
+
+    def length(self, value):
+        """A raw attribute value in user units."""
+        try:
+            # Through pixels and back, as svg.unittouu() goes, to round the same
+            return float(value) * self.to_px / self.to_px
+        except (TypeError, ValueError):
+            return self.svg.unittouu(f"{value}{self.svg.unit}")
+
+    def add(self, matrix, cx, cy, r, ident=None):
+        """Queue one circle, with its composed transform, for conversion."""
+        self.transforms.setdefault((matrix.arg1, matrix.arg2, matrix.arg3), []).append(len(self.cx))
+        if self.keys is not None:
+            self.keys.append(circle_key(ident, cx, cy, r,
+                (matrix.a, matrix.b, matrix.c, matrix.d, matrix.e, matrix.f)))
+        self.cx.append(self.length(cx))
+        self.cy.append(self.length(cy))
+        self.r.append(self.length(r))
+
+    def add_points(self, matrix, cx, cy, r, keys=None):
+        """
+        Queue many circles under one composed transform, e.g. a clone's
+        copy of its template. cx, cy and r are arrays in user units.
+        """
+        start = len(self.cx)
+        self.transforms.setdefault((matrix.arg1, matrix.arg2, matrix.arg3), []).extend(
+            range(start, start + len(cx)))
+        if self.keys is not None:
+            self.keys.frombytes(np.asarray(keys, dtype=np.uint64).tobytes())
+        self.cx.frombytes(np.asarray(cx, dtype=float).tobytes())
+        self.cy.frombytes(np.asarray(cy, dtype=float).tobytes())
+        self.r.frombytes(np.asarray(r, dtype=float).tobytes())
+
+    def local_points(self):
+        """
+        Returns (cx, cy, r) arrays with each circle's transform applied, but
+        still in user units and unflipped.
+        """
+        points = np.asarray(self.cx, dtype=float) + 1j * np.asarray(self.cy, dtype=float)
+        for (arg1, arg2, arg3), rows in self.transforms.items():
+            rows = np.asarray(rows)
+            # As Transform.capply_to_point() does it
+            points[rows] = arg1 * points[rows] + arg2 * points[rows].conjugate() + arg3
+        return points.real.copy(), points.imag.copy(), np.asarray(self.r, dtype=float)
+
+    def convert(self):
+        """
+        Returns (diameter, x, y) arrays in output units, in the order the
+        circles were added.
+        """
+        (x, y, r) = self.local_points()
+        if self.flipy:
+            y = self.height - y
+        # As svg.uutounit() does it: to pixels, then to the output unit
+        per_unit = CONVERSIONS[self.unit]
+        diameter = r * self.to_px / per_unit * 2
+        return diameter, x * self.to_px / per_unit, y * self.to_px / per_unit
+
+    def key_array(self):
+        """The circle keys as a uint64 array, or None if not keyed."""
+        if self.keys is None:
+            return None
+        return np.asarray(self.keys, dtype=np.uint64)
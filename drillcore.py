@@ -0,0 +1,409 @@
+'''
+shared hole extraction and storage for the drill exporters
+'''
+
+import inkex
+import numpy as np
+from inkex import elements
+from drillconvert import CircleBatch, circle_key
+from drillstream import StreamingInput
+from drillstats import JobStats
+from drilldedupe import find_duplicates
+
+
+class HoleGroup:
+    """
+    Holes of one drill size, as parallel float arrays of output-unit
+    coordinates. Formatting is left to whoever writes them out.
+    """
+    __slots__ = ('d', 'xs', 'ys', 'keys')
+
+    def __init__(self, d, xs, ys, keys=None):
+        self.d = d
+        self.xs = np.asarray(xs, dtype=float)
+        self.ys = np.asarray(ys, dtype=float)
+        # Per-hole circle keys (uint64), when the exporter asked for them
+        self.keys = keys
+
+    def __len__(self):
+        return len(self.xs)
+
+    def point(self, i):
+        return (float(self.xs[i]), float(self.ys[i]))
+
+    def take(self, order):
+        """A new group with the holes in the given order."""
+        order = np.asarray(order, dtype=np.intp)
+        keys = None if self.keys is None else self.keys[order]
+        return HoleGroup(self.d, self.xs[order], self.ys[order], keys)
+
+    @classmethod
+    def concat(cls, d, groups):
+        """All holes of several groups, one group after the other."""
+        groups = list(groups)
+        keys = None
+        if all(g.keys is not None for g in groups):
+            keys = np.concatenate([g.keys for g in groups])
+        return cls(d, np.concatenate([g.xs for g in groups]),
+            np.concatenate([g.ys for g in groups]), keys)
+
+
+def cluster_diameters(uniq, counts, tolerance=0.0, tools=None):
+    """
+    The drill size to use for each of the sorted, unique diameters uniq,
+    drawn counts times each.
+
+    With a tool table, each diameter goes to the nearest tool size within
+    tolerance, or the nearest of all if tolerance is zero. Without one,
+    every run of diameters within tolerance of the smallest in the run is
+    drilled at the run's most common diameter.
+    Returns (sizes, no_tool), no_tool marking diameters with no tool in range.
+    """
+    sizes = uniq.copy()
+    no_tool = np.zeros(len(uniq), dtype=bool)
+    if tools:
+        table = np.sort(np.asarray(tools, dtype=float))
+        above = np.clip(np.searchsorted(table, uniq), 0, len(table) - 1)
+        below = np.clip(above - 1, 0, len(table) - 1)
+        # Ties go to the smaller tool
+        use_below = (uniq - table[below]) <= (table[above] - uniq)
+        nearest = np.where(use_below, table[below], table[above])
+        in_range = np.abs(nearest - uniq) <= tolerance if tolerance > 0 else np.ones(len(uniq), dtype=bool)
+        sizes[in_range] = nearest[in_range]
+        no_tool = ~in_range
+    elif tolerance > 0:
+        start = 0
+        while start < len(uniq):
+            end = int(np.searchsorted(uniq, uniq[start] + tolerance, side="right"))
+            sizes[start:end] = uniq[start + int(np.argmax(counts[start:end]))]
+            start = end
+    return sizes, no_tool
+
+
+class HoleSet(dict):
+    """
+    Formatted diameter -> HoleGroup, in the order each size was first seen.
+
+    merged maps a size to the formatted diameters that were clustered into
+    it, where there was more than one (or it came from the tool table).
+    no_tool lists sizes that had no tool table size within tolerance.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.merged = {}
+        self.no_tool = []
+
+    @classmethod
+    def from_arrays(cls, diameters, xs, ys, fmt, keys=None, tolerance=0.0, tools=None):
+        """
+        Group holes whose diameters format the same with fmt, after
+        clustering them with cluster_diameters().
+        """
+        holes = cls()
+        if len(diameters) == 0:
+            return holes
+        uniq, first, inverse, counts = np.unique(diameters, return_index=True,
+            return_inverse=True, return_counts=True)
+        sizes, no_tool = cluster_diameters(uniq, counts, tolerance, tools)
+        # Several raw diameters can format to the same size
+        codes = {}
+        uniq_code = np.array([codes.setdefault(f"{u:{fmt}}", len(codes)) for u in sizes.tolist()])
+        hole_code = uniq_code[inverse.ravel()]
+        labels = list(codes)
+        # Sizes in order of first appearance, holes in document order within each
+        first_seen = np.full(len(labels), len(diameters))
+        np.minimum.at(first_seen, uniq_code, first)
+        order = np.argsort(hole_code, kind="stable")
+        bounds = np.searchsorted(hole_code[order], np.arange(len(labels) + 1))
+        for code in np.argsort(first_seen, kind="stable").tolist():
+            idx = order[bounds[code]:bounds[code + 1]]
+            holes[labels[code]] = HoleGroup(labels[code], xs[idx], ys[idx],
+                None if keys is None else keys[idx])
+
+        if tolerance > 0 or tools:
+            drawn = {}
+            for (code, u) in zip(uniq_code.tolist(), uniq.tolist()):
+                drawn.setdefault(labels[code], {}).setdefault(f"{u:{fmt}}", None)
+            for label in holes:
+                if list(drawn[label]) != [label]:
+                    holes.merged[label] = list(drawn[label])
+            holes.no_tool = sorted({labels[code] for code in uniq_code[no_tool].tolist()})
+        return holes
+
+    def hole_count(self):
+        return sum(len(group) for group in self.values())
+
+
+class DrillEffect(StreamingInput, inkex.Effect):
+    """
+    Circle extraction shared by ExportDrills and ExportGCodeDrills.
+    Subclasses add their own options, and write the holes out in effect().
+    """
+
+    def load_raw(self):
+        # Stage times and counts are collected from here on
+        self.stats = JobStats(self.options.unit)
+        with self.stats.stage('load'):
+            super().load_raw()
+
+    def prepare(self):
+        """
+        Read the document size and output settings, and start an empty
+        circle batch. Only needs the root element, so the streaming loader
+        can call it too.
+        """
+        # Get the attributes:
+        self.heightDoc = self.svg.unittouu(self.svg.get('height'))
+        self.widthDoc = self.svg.unittouu(self.svg.get('width'))
+
+        self.unit = self.options.unit
+        self.flipy = self.options.flipy
+
+        # Coordinates are kept as floats until they are written out
+        self.coord_format = ".2f" if self.unit == "mm" else ".4f"
+        # Circles are only hashed when there is a tour cache to check them against
+        keyed = getattr(self.options, 'cache', 'false') == 'true'
+        self.batch = CircleBatch(self.svg, self.unit, self.flipy == 'true', self.heightDoc, keyed)
+        # Referenced element id -> its circles, for clones
+        self.clone_templates = {}
+        self.clone_stack = set()
+
+        # Sizes to snap diameters to, or None if --tooltable can't be read
+        try:
+            self.tool_sizes = [float(size) for size in self.options.tooltable.replace(';', ',').split(',')
+                if size.strip()]
+        except ValueError:
+            inkex.utils.errormsg(f"Tool table must be a list of sizes, e.g. 0.8,1.0,1.6 - got {self.options.tooltable}")
+            self.tool_sizes = None
+
+    def process_circle(self, circle, matrix):
+        # Conversion is deferred to group_circles(), which does all circles at once
+        self.batch.add(matrix, circle.get('cx', 0), circle.get('cy', 0), circle.get('r', 0),
+            circle.get('id'))
+
+    def clone_template(self, ref):
+        """
+        The circles under a clone's referenced element, as (cx, cy, r, keys)
+        arrays in the coordinates of the element's parent. Each element is
+        only walked once, however many clones point at it.
+        """
+        ref_id = ref.get('id')
+        if ref_id in self.clone_templates:
+            return self.clone_templates[ref_id]
+        if ref_id in self.clone_stack:
+            # A clone of something that contains the clone
+            return None
+
+        self.clone_stack.add(ref_id)
+        batch = self.batch
+        self.batch = CircleBatch(self.svg, self.unit, False, 0, batch.keys is not None)
+        try:
+            self.find_circles(ref, inkex.Transform())
+            template = self.batch.local_points() + (self.batch.key_array(),)
+        finally:
+            self.batch = batch
+            self.clone_stack.discard(ref_id)
+        self.clone_templates[ref_id] = template
+        return template
+
+    def process_clone(self, clone, matrix):
+        """Stamp a copy of the clone's template out through its transform."""
+        ref = clone.href
+        if ref is None:
+            return
+        template = self.clone_template(ref)
+        if template is None or not len(template[0]):
+            return
+        (cx, cy, r, keys) = template
+        x = clone.get('x', 0)
+        y = clone.get('y', 0)
+        matrix = matrix @ inkex.Transform(translate=(self.batch.length(x), self.batch.length(y)))
+        if isinstance(ref, elements.Symbol):
+            viewport = self.symbol_viewport(clone, ref)
+            if viewport is None:
+                return
+            matrix = matrix @ viewport
+            # Sizing a symbol's clone resizes what it draws, holes and all
+            r = r * abs(viewport.a * viewport.d - viewport.b * viewport.c) ** 0.5
+        if keys is not None:
+            # Copies of the same circle must still get different keys
+            salt = circle_key(clone.get('id'), x, y, ref.get('id'),
+                (matrix.a, matrix.b, matrix.c, matrix.d, matrix.e, matrix.f))
+            keys = keys ^ np.uint64(salt)
+        self.batch.add_points(matrix, cx, cy, r, keys)
+        self.stats.clones += 1
+
+    def symbol_viewport(self, clone, symbol):
+        """
+        The transform from a symbol's viewBox into the viewport its clone
+        gives it: the clone's width and height, or else the symbol's own,
+        or else the whole document. Returns None if the symbol's viewBox is
+        empty, when nothing in it is drawn.
+        """
+        vbox = symbol.get('viewBox')
+        if vbox is None:
+            # No viewBox - the symbol is drawn in the clone's own units
+            return inkex.Transform()
+        try:
+            (vx, vy, vw, vh) = [float(v) for v in vbox.replace(',', ' ').split()]
+        except ValueError:
+            return None
+        if vw <= 0 or vh <= 0:
+            return None
+
+        doc = self.svg.get_viewbox()
+        def size(name, whole):
+            value = clone.get(name) or symbol.get(name) or '100%'
+            if value.strip().endswith('%'):
+                return float(value.strip()[:-1]) / 100 * whole
+            return self.batch.length(value)
+        (width, height) = (size('width', doc[2]), size('height', doc[3]))
+
+        # preserveAspectRatio="[defer] <align> [meet|slice]", xMidYMid meet by default
+        aspect = symbol.get('preserveAspectRatio', '').split()
+        if aspect and aspect[0] == 'defer':
+            aspect = aspect[1:]
+        align = aspect[0] if aspect else 'xMidYMid'
+        (sx, sy) = (width / vw, height / vh)
+        if align == 'none':
+            return inkex.Transform(translate=(-vx * sx, -vy * sy)) @ inkex.Transform(scale=(sx, sy))
+        scale = max(sx, sy) if aspect[1:2] == ['slice'] else min(sx, sy)
+        (tx, ty) = (-vx * scale, -vy * scale)
+        # Left over room goes before the content for Max, split for Mid
+        if 'xMid' in align:
+            tx += (width - vw * scale) / 2
+        elif 'xMax' in align:
+            tx += width - vw * scale
+        if 'YMid' in align:
+            ty += (height - vh * scale) / 2
+        elif 'YMax' in align:
+            ty += height - vh * scale
+        return inkex.Transform(translate=(tx, ty)) @ inkex.Transform(scale=scale)
+
+    def find_circles(self, root_node, parent_transform=None):
+        """
+        Walks the SVG element tree to find all circle nodes.
+
+        Uses an explicit stack rather than recursion, so deeply nested groups
+        can't hit the recursion limit. Each node's transform is composed once
+        and handed down to its children. Clones (<use>) are expanded from
+        templates; the contents of <defs> and <symbol> are only drilled
+        through clones.
+        """
+        if parent_transform is None:
+            parent = root_node.getparent()
+            if isinstance(parent, inkex.BaseElement):
+                parent_transform = parent.composed_transform()
+            else:
+                parent_transform = inkex.Transform()
+
+        stack = [(root_node, parent_transform)]
+        while stack:
+            node, parent_transform = stack.pop()
+            self.stats.elements += 1
+            matrix = parent_transform @ node.transform
+            if isinstance(node, elements.Circle):
+                self.process_circle(node, matrix)
+            elif isinstance(node, elements.Use):
+                self.process_clone(node, matrix)
+                continue
+            elif isinstance(node, (elements.Defs, elements.Symbol)) and node is not root_node:
+                continue
+
+            # Push children reversed, so they come off in document order
+            for child in reversed(node):
+                # Skip comments and other non-SVG nodes
+                if isinstance(child, inkex.BaseElement):
+                    stack.append((child, matrix))
+
+    def find_in_scope(self, scope):
+        """
+        Queue every circle in the document, layer or selection.
+        Returns False (after telling the user) if the scope or the tool
+        table can't be used.
+        """
+        if self.options.stream == "true":
+            # Circles were already queued while the file was streamed in
+            if scope != "document":
+                inkex.utils.errormsg("Streaming input only supports the Entire Document scope.")
+                return False
+            return self.tool_sizes is not None
+
+        with self.stats.stage('extract'):
+            self.prepare()
+            if self.tool_sizes is None:
+                return False
+            if scope == "selection":
+                # The `self.svg.selection` property provides the currently selected elements.
+                for node in self.svg.selection.values():
+                    self.find_circles(node)
+            elif scope == "layer":
+                # Get the currently active layer
+                current_layer = self.svg.get_current_layer()
+                if current_layer is not None:
+                    self.find_circles(current_layer)
+            elif scope == "document":
+                # The root of the SVG document is `self.document`.
+                self.find_circles(self.document.getroot())
+        return True
+
+    def group_circles(self):
+        """
+        Convert every circle found so far to output units, and group the
+        holes by diameter, clustered within --tolerance and/or snapped to
+        the --tooltable sizes. Tells the user which diameters were merged.
+        """
+        with self.stats.stage('group'):
+            diameters, xs, ys = self.batch.convert()
+            keys = self.batch.key_array()
+            if self.options.dedupe > 0:
+                (diameters, xs, ys, keys) = self.drop_duplicates(diameters, xs, ys, keys)
+            holes = HoleSet.from_arrays(diameters, xs, ys, self.coord_format, keys,
+                self.options.tolerance, self.tool_sizes)
+        self.stats.circles = len(self.batch)
+        self.stats.add_groups(holes)
+
+        for (d, drawn) in holes.merged.items():
+            inkex.utils.errormsg(f"Drilling {', '.join(drawn)}{self.unit} as {d}{self.unit} "
+                f"({len(holes[d])} holes)")
+        for d in holes.no_tool:
+            inkex.utils.errormsg(f"No tool in the table within tolerance of {d}{self.unit} - drilled as drawn")
+        return holes
+
+    def drop_duplicates(self, diameters, xs, ys, keys):
+        """
+        Take out holes within --dedupe of another, keeping the largest, and
+        warn about holes inside larger ones. Returns the arrays without them.
+        """
+        duplicates, inside = find_duplicates(xs, ys, diameters, self.options.dedupe)
+        fmt = self.coord_format
+
+        def hole(i):
+            return f"{diameters[i]:{fmt}}{self.unit} at ({xs[i]:{fmt}}, {ys[i]:{fmt}})"
+
+        # List a few of each, and count the rest
+        if len(duplicates):
+            lines = [f"  {hole(i)}" for (i, j) in duplicates[:10].tolist()]
+            if len(duplicates) > 10:
+                lines.append(f"  ... and {len(duplicates) - 10} more")
+            inkex.utils.errormsg(f"Duplicate holes removed ({len(duplicates)}):\n" + "\n".join(lines))
+        if len(inside):
+            lines = [f"  {hole(i)}, inside {hole(j)}" for (i, j) in inside[:10].tolist()]
+            if len(inside) > 10:
+                lines.append(f"  ... and {len(inside) - 10} more")
+            inkex.utils.errormsg(f"Holes inside larger holes ({len(inside)}):\n" + "\n".join(lines))
+        self.stats.duplicates = len(duplicates)
+        self.stats.inside = len(inside)
+
+        keep = np.ones(len(diameters), dtype=bool)
+        keep[duplicates[:, 0]] = False
+        return (diameters[keep], xs[keep], ys[keep], None if keys is None else keys[keep])
+
+    def report_stats(self, output):
+        """With --stats=true, save the job statistics next to output and summarize them."""
+        if self.options.stats != "true":
+            return
+        path = output + ".stats.json"
+        self.stats.save(path)
+        inkex.utils.errormsg(self.stats.summary() + f"\nStatistics saved to {path}")
@@ -0,0 +1,145 @@
+'''
+duplicate and overlapping hole detection for the drill exporters
+'''
+
+import numpy as np
+
+
+def grid_cells(xs, ys, reach):
+    """
+    Number every hole by its cell in a grid of reach-sized cells, so that
+    the cell dx columns and dy rows along from cell c is c + dx * width + dy.
+    Returns (cell numbers, width).
+    """
+    # Coarser cells than asked for if need be, to keep the numbers in an int64
+    reach = max(reach, np.ptp(xs) / 2**24, np.ptp(ys) / 2**24) or 1.0
+    cx = np.floor(xs / reach).astype(np.int64)
+    cy = np.floor(ys / reach).astype(np.int64)
+    cx -= cx.min()
+    # Room for a row either side, so a neighbour never wraps into the next column
+    cy -= cy.min() - 1
+    width = int(cy.max()) + 2
+    return cx * width + cy, width
+
+
+def hole_pairs(xs, ys, reach):
+    """
+    Every pair of holes (i, j) that could be within reach of each other,
+    each pair once, as two index arrays.
+
+    Holes are hashed into a grid of reach-sized cells, so only the holes in
+    a cell and its neighbours are compared. Each round pairs every hole
+    with the next hole along in a neighbouring cell, which keeps the work
+    in numpy; there are as many rounds as the fullest cell has holes.
+    """
+    n = len(xs)
+    if n < 2:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+    keys, width = grid_cells(xs, ys, reach)
+    order = np.argsort(keys, kind="stable")
+    cells = keys[order]
+
+    first = []
+    second = []
+    # Half the neighbours; the other half see this cell as their neighbour
+    for (dx, dy) in ((0, 0), (0, 1), (1, -1), (1, 0), (1, 1)):
+        target = cells + dx * width + dy
+        hi = np.searchsorted(cells, target, side="right")
+        if dx == 0 and dy == 0:
+            # Same cell - only the holes after this one
+            lo = np.arange(1, n + 1)
+        else:
+            lo = np.searchsorted(cells, target, side="left")
+        span = hi - lo
+        for step in range(int(span.max(initial=0))):
+            rows = np.nonzero(span > step)[0]
+            first.append(order[rows])
+            second.append(order[lo[rows] + step])
+    if not first:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+    return np.concatenate(first), np.concatenate(second)
+
+
+def inside_pairs(xs, ys, ds, holes, tolerance):
+    """
+    Pairs (small, large) of the given holes where the small hole could lie
+    inside the large one, as two index arrays.
+
+    Each hole only needs comparing with smaller holes within its radius
+    plus tolerance. The larger holes are taken in classes whose reaches are
+    within a factor of two, and each class is compared through a grid of
+    its own cell size - so a board of small holes is never paired through
+    the reach of its one large hole, only that hole is.
+    """
+    first = []
+    second = []
+    if not len(holes):
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+    # The smallest holes have nothing smaller to hold
+    holders = holes[ds[holes] > ds[holes].min()]
+    reach = ds[holders] / 2 + tolerance
+    size_class = np.floor(np.log2(reach)).astype(np.int64)
+    for size in np.unique(size_class):
+        large = holders[size_class == size]
+        small = holes[ds[holes] < ds[large].max()]
+        # Cells as large as the largest reach in the class
+        keys, width = grid_cells(xs, ys, 2.0 ** (size + 1))
+        order = small[np.argsort(keys[small], kind="stable")]
+        cells = keys[order]
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                target = keys[large] + dx * width + dy
+                lo = np.searchsorted(cells, target, side="left")
+                count = np.searchsorted(cells, target, side="right") - lo
+                # Every hole of each large hole's cell range, without a Python loop
+                starts = np.repeat(lo - np.cumsum(count) + count, count)
+                i = order[starts + np.arange(int(count.sum()))]
+                j = np.repeat(large, count)
+                smaller = ds[i] < ds[j]
+                first.append(i[smaller])
+                second.append(j[smaller])
+    if not first:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp)
+    return np.concatenate(first), np.concatenate(second)
+
+
+def find_duplicates(xs, ys, ds, tolerance):
+    """
+    Holes to drop as duplicates, and holes that sit inside larger ones.
+
+    Holes whose centres are within tolerance are duplicates: the largest is
+    kept, or the first in document order if they are the same size. A hole
+    that lies wholly inside a larger hole (to within tolerance) is only
+    flagged. Returns (duplicates, inside), each an (n, 2) array of
+    (hole, the hole it duplicates or sits in).
+    """
+    xs = np.asarray(xs, dtype=float)
+    ys = np.asarray(ys, dtype=float)
+    ds = np.asarray(ds, dtype=float)
+    none = np.empty((0, 2), dtype=np.intp)
+    if len(xs) < 2:
+        return none, none
+
+    i, j = hole_pairs(xs, ys, tolerance)
+    same = np.hypot(xs[i] - xs[j], ys[i] - ys[j]) <= tolerance
+    (i, j) = (i[same], j[same])
+
+    # Order each pair as (dropped hole, kept hole)
+    swap = (ds[i] > ds[j]) | ((ds[i] == ds[j]) & (i < j))
+    duplicates = np.column_stack((np.where(swap, j, i), np.where(swap, i, j)))
+    # Report each dropped hole once
+    _, once = np.unique(duplicates[:, 0], return_index=True)
+    duplicates = duplicates[once]
+
+    # Only the holes that are kept can sit in one another
+    dropped = np.zeros(len(xs), dtype=bool)
+    dropped[duplicates[:, 0]] = True
+    small, large = inside_pairs(xs, ys, ds, np.nonzero(~dropped)[0], tolerance)
+    dist = np.hypot(xs[small] - xs[large], ys[small] - ys[large])
+    inside = (dist > tolerance) & (dist + ds[small] / 2 <= ds[large] / 2 + tolerance)
+    inside = np.column_stack((small[inside], large[inside]))
+    # Name the first hole in document order that each one sits in
+    inside = inside[np.lexsort((inside[:, 1], inside[:, 0]))]
+    _, once = np.unique(inside[:, 0], return_index=True)
+    inside = inside[once]
+    return duplicates, inside
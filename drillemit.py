@@ -0,0 +1,110 @@
+'''
+buffered g-code output for the drill exporter
+'''
+
+
+def trim_zeros(word):
+    """Drop trailing zeros (and a bare decimal point) from a number."""
+    if '.' in word:
+        word = word.rstrip('0').rstrip('.')
+    if word in ('', '-', '-0'):
+        word = '0'
+    return word
+
+
+class GCodeEmitter:
+    """
+    Builds G-code text in memory and writes it to the stream in large
+    chunks.
+
+    Templates (header, tool setup, cycle start and end) go through
+    template(). Hole positions go through moves(). With modal=True, an X or
+    Y word that hasn't changed since the previous hole is left out. With
+    trim=True, trailing zeros are dropped from coordinates. The emitter
+    counts the characters that would have been written without either
+    option, so it can report what they saved.
+    """
+
+    def __init__(self, stream, coord_format, modal=False, trim=False, chunk_size=1 << 20):
+        self.stream = stream
+        self.coord_format = coord_format
+        self.modal = modal
+        self.trim = trim
+        self.chunk_size = chunk_size
+        self.buffer = []
+        self.buffered = 0
+        self.written = 0
+        self.full_size = 0
+        self.last_x = None
+        self.last_y = None
+
+    def write(self, text, full_size=None):
+        self.buffer.append(text)
+        self.buffered += len(text)
+        self.full_size += len(text) if full_size is None else full_size
+        if self.buffered >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.stream.write("".join(self.buffer))
+            self.written += self.buffered
+            self.buffer = []
+            self.buffered = 0
+
+    def close(self):
+        """Write out whatever is left. The stream itself is left open."""
+        self.flush()
+
+    def saved(self):
+        return self.full_size - self.written - self.buffered
+
+    def number(self, value):
+        word = f"{value:{self.coord_format}}"
+        return trim_zeros(word) if self.trim else word
+
+    def xy(self, x, y):
+        """Both X and Y words, e.g. for a template's first position."""
+        words = f"X{self.number(x)} Y{self.number(y)}"
+        # Count what trimming took off, as template() can't see it
+        self.full_size += len(f"X{x:{self.coord_format}} Y{y:{self.coord_format}}") - len(words)
+        return words
+
+    def template(self, template, **kwargs):
+        """
+        Write a formatted template. Templates can move the machine anywhere,
+        so the next hole always gets both of its words.
+        """
+        self.write(template.format(**kwargs))
+        self.last_x = None
+        self.last_y = None
+
+    def position(self, x, y):
+        """Tell the emitter the machine is at (x, y), e.g. after a template's G0."""
+        self.last_x = f"{x:{self.coord_format}}"
+        self.last_y = f"{y:{self.coord_format}}"
+
+    def moves(self, xs, ys):
+        """One line per hole, under the canned cycle that is already active."""
+        fmt = self.coord_format
+        modal = self.modal
+        trim = self.trim
+        last_x = self.last_x
+        last_y = self.last_y
+        for (x, y) in zip(xs, ys):
+            sx = f"{x:{fmt}}"
+            sy = f"{y:{fmt}}"
+            full = len(sx) + len(sy) + 4
+            words = []
+            if not modal or sx != last_x:
+                words.append("X" + (trim_zeros(sx) if trim else sx))
+            if not modal or sy != last_y:
+                words.append("Y" + (trim_zeros(sy) if trim else sy))
+            if not words:
+                # Same spot again - still needs a word to repeat the cycle
+                words.append("X" + (trim_zeros(sx) if trim else sx))
+            self.write(" ".join(words) + "\n", full)
+            last_x = sx
+            last_y = sy
+        self.last_x = last_x
+        self.last_y = last_y
@@ -0,0 +1,265 @@
+#! /usr/bin/env python
+'''
+machining time estimate for drill programs
+
+usage: drillestimate.py [--rapid RATE] [--toolchange SECONDS] [--dwell SECONDS] FILE...
+
+Simulates the G-code the drill exporter writes: rapids, tool changes, and
+G81/G83 canned cycles at the programmed feed, and pattern subprograms
+(o-word sub/call or O/M98/M99) run at their G52 shifts. RATE is the rapid rate in
+program units per minute.
+'''
+
+import argparse
+import math
+import re
+import sys
+
+# Rapid rate used when none is given, per minute
+DEFAULT_RAPID = {'in': 200.0, 'mm': 5080.0}
+
+WORD = re.compile(r'([A-Z])\s*([-+]?[0-9]*\.?[0-9]+)')
+COMMENT = re.compile(r'\([^)]*\)|;.*')
+# LinuxCNC o-word subroutines, and Fanuc style O-numbered subprograms
+NGC_SUB = re.compile(r'\s*O(\d+)\s+SUB\b')
+NGC_ENDSUB = re.compile(r'\s*O(\d+)\s+ENDSUB\b')
+NGC_CALL = re.compile(r'\s*O(\d+)\s+CALL\b')
+FANUC_SUB = re.compile(r'\s*O(\d+)\b')
+
+
+class CycleEstimate:
+    """
+    Estimated run time of a drill program, in seconds, per tool.
+
+    Rapids are straight-line moves at the rapid rate. A canned cycle at each
+    hole rapids to R, feeds to Z at F and rapids back out; G83 also rapids
+    out to R and back down after every peck of Q. Tool changes (M6) take a
+    fixed time, and each hole can add a dwell at the bottom. Moves to the
+    G30 position are left out, as where that is isn't in the program.
+    Subprograms are run where they are called, shifted by any G52 offset.
+    """
+
+    def __init__(self, rapid=None, toolchange=10.0, dwell=0.0):
+        self.rapid = rapid
+        self.toolchange = toolchange
+        self.dwell = dwell
+        self.unit = 'in'
+        self.tools = {}
+        self.order = []
+        self.tool = None
+        self.holes = 0
+        self.pos = [0.0, 0.0, 0.0]
+        self.feed = None
+        self.cycle = None
+        self.retract_initial = True
+        self.initial_z = 0.0
+        self.offset = [0.0, 0.0]
+        self.subs = {}
+
+    def rapid_rate(self):
+        """Rapid rate per second."""
+        return (self.rapid or DEFAULT_RAPID[self.unit]) / 60.0
+
+    def spend(self, seconds, kind):
+        entry = self.tools.get(self.tool)
+        if entry is None:
+            entry = self.tools[self.tool] = dict(tool=self.tool, rapid=0.0, feed=0.0,
+                toolchange=0.0, dwell=0.0, holes=0)
+            self.order.append(self.tool)
+        entry[kind] += seconds
+
+    def rapid_to(self, x=None, y=None, z=None):
+        target = [self.pos[0] if x is None else x, self.pos[1] if y is None else y,
+            self.pos[2] if z is None else z]
+        dist = math.dist(self.pos, target)
+        self.pos = target
+        self.spend(dist / self.rapid_rate(), 'rapid')
+
+    def feed_to(self, z):
+        dist = abs(self.pos[2] - z)
+        self.pos[2] = z
+        if self.feed:
+            self.spend(dist / (self.feed / 60.0), 'feed')
+
+    def drill(self):
+        """One canned cycle at the current XY position."""
+        (kind, z, r, q) = self.cycle
+        self.rapid_to(z=r)
+        if kind == 83 and q:
+            depth = r
+            while depth - q > z:
+                # Peck, back out to R, and rapid back down to the last depth
+                self.feed_to(depth - q)
+                depth -= q
+                self.rapid_to(z=r)
+                self.rapid_to(z=depth)
+        self.feed_to(z)
+        self.spend(self.dwell, 'dwell')
+        self.rapid_to(z=max(self.initial_z, r) if self.retract_initial else r)
+        self.tools[self.tool]['holes'] += 1
+        self.holes += 1
+
+    def split_subs(self, lines):
+        """
+        Take the subprogram definitions out of a program, keeping them by
+        number, and return the main program's lines. An O-numbered block
+        only counts as a subprogram if it ends in M99 before any M30.
+        """
+        main = []
+        lines = [COMMENT.sub('', text).upper() for text in lines]
+        k = 0
+        while k < len(lines):
+            text = lines[k]
+            start = NGC_SUB.match(text)
+            if start:
+                end = k + 1
+                while end < len(lines) and not NGC_ENDSUB.match(lines[end]):
+                    end += 1
+                self.subs[int(start.group(1))] = lines[k + 1:end]
+                k = end + 1
+                continue
+            start = FANUC_SUB.match(text) if not NGC_CALL.match(text) else None
+            if start:
+                end = k + 1
+                while end < len(lines) and not re.search(r'\bM(99|30|2)\b', lines[end]):
+                    end += 1
+                if end < len(lines) and re.search(r'\bM99\b', lines[end]):
+                    self.subs[int(start.group(1))] = lines[k + 1:end]
+                    k = end + 1
+                    continue
+            main.append(text)
+            k += 1
+        return main
+
+    def call(self, number):
+        for text in self.subs.get(number, ()):
+            self.line(text)
+
+    def line(self, text):
+        """Run one line of G-code."""
+        text = COMMENT.sub('', text).upper()
+        call = NGC_CALL.match(text)
+        if call:
+            self.call(int(call.group(1)))
+            return
+        words = WORD.findall(text)
+        if not words:
+            return
+        codes = {}
+        gcodes = []
+        mcodes = []
+        for (letter, value) in words:
+            if letter == 'G':
+                gcodes.append(round(float(value), 1))
+            elif letter == 'M':
+                mcodes.append(int(float(value)))
+            else:
+                codes[letter] = float(value)
+
+        if 20 in gcodes:
+            self.unit = 'in'
+        if 21 in gcodes:
+            self.unit = 'mm'
+        if 'F' in codes:
+            self.feed = codes['F']
+        if 98 in gcodes:
+            self.retract_initial = True
+        if 99 in gcodes:
+            self.retract_initial = False
+        if 6 in mcodes:
+            self.tool = int(codes.get('T', 0))
+            self.spend(self.toolchange, 'toolchange')
+        if 98 in mcodes and 'P' in codes:
+            self.call(int(codes['P']))
+            return
+        if 52 in gcodes:
+            # Shifts the X/Y words that follow, without moving
+            self.offset = [codes.get('X', 0.0), codes.get('Y', 0.0)]
+            return
+        if 30 in gcodes or 28 in gcodes:
+            # Off to a preset position we know nothing about
+            return
+        if 80 in gcodes:
+            self.cycle = None
+        x = codes.get('X')
+        y = codes.get('Y')
+        z = codes.get('Z')
+        if x is not None:
+            x += self.offset[0]
+        if y is not None:
+            y += self.offset[1]
+
+        if 81 in gcodes or 83 in gcodes:
+            kind = 83 if 83 in gcodes else 81
+            self.initial_z = self.pos[2]
+            self.cycle = (kind, z, codes.get('R', self.pos[2]), codes.get('Q') if kind == 83 else None)
+            if x is not None or y is not None:
+                self.rapid_to(x, y)
+            self.drill()
+        elif self.cycle is not None and (x is not None or y is not None):
+            self.rapid_to(x, y)
+            self.drill()
+        elif x is not None or y is not None or z is not None:
+            # G0, G43 and anything else that moves is taken as a rapid
+            self.rapid_to(x, y, z)
+
+    def run(self, lines):
+        for text in self.split_subs(lines):
+            self.line(text)
+        return self
+
+    def total(self):
+        return sum(entry['rapid'] + entry['feed'] + entry['toolchange'] + entry['dwell']
+            for entry in self.tools.values())
+
+    def per_tool(self):
+        """(tool, seconds, holes) in the order the tools are used."""
+        return [(tool, self.tools[tool]['rapid'] + self.tools[tool]['feed']
+            + self.tools[tool]['toolchange'] + self.tools[tool]['dwell'],
+            self.tools[tool]['holes']) for tool in self.order]
+
+    def report(self):
+        return dict(seconds=round(self.total(), 3), holes=self.holes,
+            tools=[{k: (round(v, 3) if isinstance(v, float) else v) for (k, v) in entry.items()}
+                for entry in (self.tools[tool] for tool in self.order)])
+
+
+def format_time(seconds):
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+
+def summary(estimate):
+    """A line per tool, and the total."""
+    lines = []
+    for (tool, seconds, holes) in estimate.per_tool():
+        if tool is None:
+            lines.append(f"  setup: {format_time(seconds)}")
+        else:
+            lines.append(f"  T{tool}: {format_time(seconds)} ({holes} holes)")
+    lines.append(f"  total: {format_time(estimate.total())}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rapid', type=float, default=0,
+        help='rapid rate, units per minute (default 200 in/min or 5080 mm/min)')
+    parser.add_argument('--toolchange', type=float, default=10.0,
+        help='seconds per tool change')
+    parser.add_argument('--dwell', type=float, default=0.0,
+        help='seconds of dwell at the bottom of each hole')
+    parser.add_argument('files', nargs='+', help='G-code files')
+    args = parser.parse_args(argv)
+
+    for path in args.files:
+        with open(path) as program:
+            estimate = CycleEstimate(args.rapid, args.toolchange, args.dwell).run(program)
+        print(f"{path}:")
+        print(summary(estimate))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
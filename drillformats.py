@@ -0,0 +1,63 @@
+'''
+compact output formats for the CSV exporter: Excellon drill files, and a
+binary hole table
+'''
+
+import numpy as np
+from drillpattern import written
+
+# Digits before and after the point in Excellon coordinates, per unit
+EXCELLON_DIGITS = {'in': (2, 4), 'mm': (3, 3)}
+
+
+def excellon_text(circle_groups, unit):
+    """
+    An Excellon drill file for every hole: a header with one tool per
+    diameter, then each tool's holes. Coordinates are integers in the
+    unit's 2.4 (inch) or 3.3 (mm) format, leading zeros left out.
+    """
+    (whole, decimals) = EXCELLON_DIGITS[unit]
+    lines = ["M48", f";FILE_FORMAT={whole}:{decimals}",
+        ("INCH" if unit == "in" else "METRIC") + ",TZ"]
+    for (tool, d) in enumerate(circle_groups, 1):
+        lines.append(f"T{tool}C{float(d):.{decimals}f}")
+    lines += ["%", "G90", "G05"]
+    for (tool, group) in enumerate(circle_groups.values(), 1):
+        lines.append(f"T{tool}")
+        # Rounded as the other writers round, not as value * 10**decimals does
+        xs = written(group.xs, decimals).tolist()
+        ys = written(group.ys, decimals).tolist()
+        lines.extend([f"X{x}Y{y}" for (x, y) in zip(xs, ys)])
+    lines.append("M30")
+    return "\n".join(lines) + "\n"
+
+
+def write_excellon(path, circle_groups, unit):
+    with open(path, "w", newline="") as drillfile:
+        drillfile.write(excellon_text(circle_groups, unit))
+
+
+def hole_table(circle_groups):
+    """
+    Every hole as a (3, holes) float64 array, one row each for diameter,
+    x and y, so that each column of the table is contiguous.
+    """
+    table = np.empty((3, circle_groups.hole_count()))
+    start = 0
+    for (d, group) in circle_groups.items():
+        end = start + len(group)
+        table[0, start:end] = float(d)
+        table[1, start:end] = group.xs
+        table[2, start:end] = group.ys
+        start = end
+    return table
+
+
+def write_hole_table(path, circle_groups, unit=None):
+    """
+    Save the hole table as a .npy file. np.load(path, mmap_mode='r') maps
+    it without reading it in; row 0 is then every diameter, and so on.
+    Values are in the export's unit, which the file doesn't record.
+    """
+    with open(path, "wb") as tablefile:
+        np.save(tablefile, hole_table(circle_groups))
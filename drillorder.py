@@ -0,0 +1,465 @@
+'''
+hole ordering for the drill exporters
+'''
+
+import math
+import time
+import numpy as np
+
+
+class HoleIndex:
+    """
+    Static KD-tree over hole centers, with deletion.
+
+    Holes are removed as they are visited. Each node keeps a count of the
+    holes still present below it, so nearest() never descends into a
+    subtree that has been emptied.
+    """
+
+    def __init__(self, xs, ys, leaf_size=8):
+        self.xs = xs
+        self.ys = ys
+        n = len(xs)
+        self.perm = list(range(n))
+        self.gone = [False] * n
+        self.leaf_of = [0] * n
+
+        # Node arrays - children are -1 for leaves
+        self.lo = []
+        self.hi = []
+        self.left = []
+        self.right = []
+        self.parent = []
+        self.axis = []
+        self.split = []
+        self.alive = []
+        self.minx = []
+        self.maxx = []
+        self.miny = []
+        self.maxy = []
+
+        stack = [(self._new_node(0, n, -1), 0, n)]
+        while stack:
+            node, lo, hi = stack.pop()
+            idx = self.perm[lo:hi]
+            if not idx:
+                continue
+            nxs = [xs[i] for i in idx]
+            nys = [ys[i] for i in idx]
+            self.minx[node] = min(nxs)
+            self.maxx[node] = max(nxs)
+            self.miny[node] = min(nys)
+            self.maxy[node] = max(nys)
+            if hi - lo <= leaf_size:
+                for i in idx:
+                    self.leaf_of[i] = node
+                continue
+            # Split on the wider side of the box, at the median
+            if self.maxx[node] - self.minx[node] >= self.maxy[node] - self.miny[node]:
+                axis, coords = 0, xs
+            else:
+                axis, coords = 1, ys
+            idx.sort(key=coords.__getitem__)
+            self.perm[lo:hi] = idx
+            mid = (lo + hi) // 2
+            self.axis[node] = axis
+            self.split[node] = coords[self.perm[mid]]
+            left = self._new_node(lo, mid, node)
+            right = self._new_node(mid, hi, node)
+            self.left[node] = left
+            self.right[node] = right
+            stack.append((left, lo, mid))
+            stack.append((right, mid, hi))
+
+    def _new_node(self, lo, hi, parent):
+        self.lo.append(lo)
+        self.hi.append(hi)
+        self.left.append(-1)
+        self.right.append(-1)
+        self.parent.append(parent)
+        self.axis.append(0)
+        self.split.append(0.0)
+        self.alive.append(hi - lo)
+        self.minx.append(0.0)
+        self.maxx.append(0.0)
+        self.miny.append(0.0)
+        self.maxy.append(0.0)
+        return len(self.lo) - 1
+
+    def __len__(self):
+        return self.alive[0] if self.alive else 0
+
+    def remove(self, i):
+        """Remove hole i from the index."""
+        if self.gone[i]:
+            return
+        self.gone[i] = True
+        node = self.leaf_of[i]
+        while node >= 0:
+            self.alive[node] -= 1
+            node = self.parent[node]
+
+    def nearest(self, x, y):
+        """
+        Index of the remaining hole nearest to (x, y), or -1 if none are left.
+        Ties go to the lowest index, matching a linear min() scan.
+        """
+        xs, ys, gone, perm = self.xs, self.ys, self.gone, self.perm
+        alive, left, right = self.alive, self.left, self.right
+        minx, maxx, miny, maxy = self.minx, self.maxx, self.miny, self.maxy
+        lo, hi, axis, split = self.lo, self.hi, self.axis, self.split
+        hypot = math.hypot
+        best_d = math.inf
+        best_i = -1
+        stack = [0] if alive else []
+        while stack:
+            node = stack.pop()
+            if not alive[node]:
+                continue
+            dx = max(minx[node] - x, 0.0, x - maxx[node])
+            dy = max(miny[node] - y, 0.0, y - maxy[node])
+            # Small slack so float rounding never prunes an equal-distance tie
+            if hypot(dx, dy) > best_d * (1 + 1e-12):
+                continue
+            if left[node] < 0:
+                for k in range(lo[node], hi[node]):
+                    i = perm[k]
+                    if gone[i]:
+                        continue
+                    d = hypot(x - xs[i], y - ys[i])
+                    if d < best_d or (d == best_d and i < best_i):
+                        best_d = d
+                        best_i = i
+                continue
+            # Visit the side containing the point first
+            c = x if axis[node] == 0 else y
+            if c < split[node]:
+                stack.append(right[node])
+                stack.append(left[node])
+            else:
+                stack.append(left[node])
+                stack.append(right[node])
+        return best_i
+
+
+def nearest_point(xs, ys, x, y):
+    """Index of the point nearest to (x, y), lowest index on ties."""
+    return int(np.argmin(np.hypot(np.asarray(xs) - x, np.asarray(ys) - y)))
+
+
+def nearest_neighbor_order(xs, ys, start_index=0):
+    """
+    Greedy nearest-neighbor visit order over float coordinate arrays.
+    Returns a list of indices.
+    """
+    n = len(xs)
+    if n == 0:
+        return []
+    index = HoleIndex(xs, ys)
+    index.remove(start_index)
+    path = [start_index]
+    last = start_index
+    for _ in range(n - 1):
+        last = index.nearest(xs[last], ys[last])
+        index.remove(last)
+        path.append(last)
+    return path
+
+
+def hilbert_index(x, y, order):
+    """Position along a Hilbert curve of the integer points (x, y) in [0, 2**order)."""
+    x = np.array(x, dtype=np.int64)
+    y = np.array(y, dtype=np.int64)
+    size = 1 << order
+    d = np.zeros(len(x), dtype=np.int64)
+    s = size >> 1
+    while s > 0:
+        rx = (x & s) > 0
+        ry = (y & s) > 0
+        d += s * s * ((3 * rx) ^ ry)
+        # Turn the quadrant so the curve inside it runs the right way
+        flip = ~ry & rx
+        x = np.where(flip, size - 1 - x, x)
+        y = np.where(flip, size - 1 - y, y)
+        (x, y) = (np.where(ry, x, y), np.where(ry, y, x))
+        s >>= 1
+    return d
+
+
+def nearer_end_first(order, xs, ys, start_index):
+    """
+    A curve order as a list, reversed if its last hole is nearer to hole
+    start_index than its first. Starting at start_index itself would cut
+    the curve there, and add a jump from its end back to its start.
+    """
+    (x, y) = (xs[start_index], ys[start_index])
+    (first, last) = (order[0], order[-1])
+    if math.hypot(xs[last] - x, ys[last] - y) < math.hypot(xs[first] - x, ys[first] - y):
+        order = order[::-1]
+    return order.tolist()
+
+
+def hilbert_order(xs, ys, start_index=0, order=16):
+    """
+    Visit order along a Hilbert curve over the holes' bounding square,
+    quantized to 2**order steps a side. One sort, so fast enough for any
+    number of holes, at the cost of a longer tour than nearest-neighbor.
+    The tour starts at whichever end of the curve is nearer start_index.
+    """
+    xs = np.asarray(xs, dtype=float)
+    ys = np.asarray(ys, dtype=float)
+    if len(xs) == 0:
+        return []
+    span = max(xs.max() - xs.min(), ys.max() - ys.min()) or 1.0
+    steps = (1 << order) - 1
+    qx = ((xs - xs.min()) / span * steps).astype(np.int64)
+    qy = ((ys - ys.min()) / span * steps).astype(np.int64)
+    return nearer_end_first(np.argsort(hilbert_index(qx, qy, order), kind="stable"), xs, ys, start_index)
+
+
+def serpentine_order(xs, ys, start_index=0):
+    """
+    Visit order in horizontal strips, left to right then right to left.
+    The strips are sqrt(2 * area / holes) high, about right for holes
+    spread evenly. One sort, like hilbert_order.
+    """
+    xs = np.asarray(xs, dtype=float)
+    ys = np.asarray(ys, dtype=float)
+    n = len(xs)
+    if n == 0:
+        return []
+    width = xs.max() - xs.min()
+    height = ys.max() - ys.min()
+    strip = math.sqrt(2.0 * width * height / n) or (max(width, height) / math.sqrt(n)) or 1.0
+    row = np.floor((ys - ys.min()) / strip).astype(np.int64)
+    along = np.where(row % 2 == 1, -xs, xs)
+    return nearer_end_first(np.lexsort((along, row)), xs, ys, start_index)
+
+
+# Tour construction for each --ordering choice
+ORDERINGS = {
+    'nearest': nearest_neighbor_order,
+    'hilbert': hilbert_order,
+    'serpentine': serpentine_order,
+}
+
+
+def tour_length(xs, ys, path):
+    """Total travel along path, not returning to the start."""
+    return sum(math.hypot(xs[a] - xs[b], ys[a] - ys[b])
+               for a, b in zip(path, path[1:]))
+
+
+def near_holes(xs, ys, k=8, window=12, shifts=3, order=16):
+    """
+    Roughly the k nearest other holes of every hole, as an (n, k) array,
+    -1 where there are fewer. Candidates are the holes within window
+    places along Hilbert curves over the holes, the curve shifted each
+    time so that holes either side of one of its seams still meet. All
+    numpy, so about the same time per hole however they are laid out.
+    """
+    xs = np.asarray(xs, dtype=float)
+    ys = np.asarray(ys, dtype=float)
+    n = len(xs)
+    span = max(xs.max() - xs.min(), ys.max() - ys.min()) or 1.0
+    steps = (1 << order) - 1
+    along = np.concatenate((np.arange(-window, 0), np.arange(1, window + 1)))
+    best_i = best_d = None
+    for shift in range(shifts):
+        offset = span * shift / shifts / 2
+        qx = ((xs - xs.min() + offset) / (span * 1.5) * steps).astype(np.int64)
+        qy = ((ys - ys.min() + offset) / (span * 1.5) * steps).astype(np.int64)
+        curve = np.argsort(hilbert_index(qx, qy, order), kind="stable")
+        cx = xs[curve]
+        cy = ys[curve]
+        # The holes either side of each one along the curve
+        rank = np.arange(n)[:, None] + along[None, :]
+        valid = (rank >= 0) & (rank < n)
+        rank = np.clip(rank, 0, n - 1)
+        dist = (cx[rank] - cx[:, None]) ** 2 + (cy[rank] - cy[:, None]) ** 2
+        dist[~valid] = np.inf
+        top = np.argpartition(dist, k - 1, axis=1)[:, :k]
+        near_i = np.empty((n, k), dtype=np.int64)
+        near_d = np.empty((n, k))
+        near_i[curve] = curve[np.take_along_axis(rank, top, 1)]
+        near_d[curve] = np.take_along_axis(dist, top, 1)
+        if best_i is None:
+            (best_i, best_d) = (near_i, near_d)
+            continue
+        # Merge with the earlier curves, counting each hole once
+        idx = np.concatenate((best_i, near_i), axis=1)
+        dist = np.concatenate((best_d, near_d), axis=1)
+        by_index = np.argsort(idx, axis=1)
+        idx = np.take_along_axis(idx, by_index, 1)
+        dist = np.take_along_axis(dist, by_index, 1)
+        dist[:, 1:][idx[:, 1:] == idx[:, :-1]] = np.inf
+        top = np.argpartition(dist, k - 1, axis=1)[:, :k]
+        best_i = np.take_along_axis(idx, top, 1)
+        best_d = np.take_along_axis(dist, top, 1)
+    best_i[~np.isfinite(best_d)] = -1
+    return best_i
+
+
+def improve_tour(xs, ys, path, time_budget=0.0, max_passes=0, neighbours=8):
+    """
+    Shorten an open tour with 2-opt and Or-opt moves.
+
+    The first hole stays first. Moves are only tried between each hole
+    and its nearest neighbours (from near_holes), so each costs about the
+    same however long the tour is. Holes are taken longest outgoing edge
+    first, so a short budget is spent where it pays, until a pass finds
+    nothing, max_passes passes have run or time_budget seconds have gone
+    by (0 for no limit on either).
+    Returns the new visit order as a list of indices.
+    """
+    n = len(path)
+    if n < 4:
+        return list(path)
+    deadline = time.monotonic() + time_budget if time_budget > 0 else math.inf
+    ax = np.asarray(xs, dtype=float)
+    ay = np.asarray(ys, dtype=float)
+    (X, Y) = (ax.tolist(), ay.tolist())
+    near = near_holes(ax, ay, min(neighbours, n - 1)).tolist()
+    order = np.array(path, dtype=np.intp)
+    pos = np.full(len(X), -1, dtype=np.intp)
+    pos[order] = np.arange(n)
+    hypot = math.hypot
+    eps = 1e-9
+
+    def dist(a, b):
+        return hypot(X[a] - X[b], Y[a] - Y[b])
+
+    def put(lo, holes):
+        # Write holes into the tour from position lo, and note where they went
+        order[lo:lo + len(holes)] = holes
+        pos[holes] = np.arange(lo, lo + len(holes))
+
+    def two_opt(a):
+        # Replace the edge a-b with one from a to a neighbour c, reversing
+        # the stretch of tour between them
+        i = int(pos[a])
+        if i >= n - 1:
+            return False
+        b = int(order[i + 1])
+        ab = dist(a, b)
+        best = None
+        best_gain = eps
+        for c in near[a]:
+            if c < 0:
+                continue
+            j = int(pos[c])
+            if j > i + 1:
+                # a b ... c d  ->  a c ... b d
+                if j < n - 1:
+                    d = int(order[j + 1])
+                    gain = ab + dist(c, d) - dist(a, c) - dist(b, d)
+                else:
+                    gain = ab - dist(a, c)
+                if gain > best_gain:
+                    (best, best_gain) = ((i + 1, j), gain)
+            elif j < i - 1:
+                # c d ... a b  ->  c a ... d b
+                d = int(order[j + 1])
+                gain = dist(c, d) + ab - dist(c, a) - dist(d, b)
+                if gain > best_gain:
+                    (best, best_gain) = ((j + 1, i), gain)
+        if best is None:
+            return False
+        (lo, hi) = best
+        put(lo, order[lo:hi + 1][::-1].copy())
+        return True
+
+    def or_opt(a, seg_len):
+        # Move the seg_len holes after a (maybe reversed) next to a
+        # neighbour of either end
+        s = int(pos[a]) + 1
+        t = s + seg_len - 1
+        if t > n - 1:
+            return False
+        (f, l, prev) = (int(order[s]), int(order[t]), int(order[s - 1]))
+        if t < n - 1:
+            nxt = int(order[t + 1])
+            removed = dist(prev, f) + dist(l, nxt) - dist(prev, nxt)
+        else:
+            removed = dist(prev, f)
+        best = None
+        best_gain = eps
+        for c in near[f] + near[l]:
+            if c < 0:
+                continue
+            for p in (int(pos[c]) - 1, int(pos[c])):
+                # Between p and p + 1, outside the segment and its old place
+                if p < 0 or s - 1 <= p <= t:
+                    continue
+                P = int(order[p])
+                if p < n - 1:
+                    Q = int(order[p + 1])
+                    pq = dist(P, Q)
+                    forward = dist(P, f) + dist(l, Q) - pq
+                    backward = dist(P, l) + dist(f, Q) - pq
+                else:
+                    forward = dist(P, f)
+                    backward = dist(P, l)
+                if removed - forward > best_gain:
+                    (best, best_gain) = ((p, False), removed - forward)
+                if removed - backward > best_gain:
+                    (best, best_gain) = ((p, True), removed - backward)
+        if best is None:
+            return False
+        (p, backward) = best
+        seg = order[s:t + 1]
+        if backward:
+            seg = seg[::-1]
+        if p < s:
+            put(p + 1, np.concatenate((seg, order[p + 1:s])))
+        else:
+            put(s, np.concatenate((order[t + 1:p + 1], seg)))
+        return True
+
+    passes = 0
+    improved = True
+    while improved and (max_passes <= 0 or passes < max_passes):
+        improved = False
+        passes += 1
+        # Longest edges first, so a short budget is spent where it pays
+        edges = np.hypot(np.diff(ax[order]), np.diff(ay[order]))
+        for a in order[:-1][np.argsort(-edges, kind="stable")].tolist():
+            if time.monotonic() > deadline:
+                return order.tolist()
+            if two_opt(a):
+                improved = True
+                continue
+            for seg_len in (1, 2, 3):
+                if or_opt(a, seg_len):
+                    improved = True
+                    break
+    return order.tolist()
+
+
+def order_tour(xs, ys, start_index=0, time_budget=0.0, max_passes=0, ordering='nearest'):
+    """
+    Tour from start_index (for a space-filling curve, from the end of the
+    curve nearer to it), built as the ordering says, then 2-opt/Or-opt if a time budget or
+    pass limit is given. A plain function of its arguments, so it can run
+    in a worker process.
+
+    Returns (path, length before improvement, length after), the lengths
+    None if there was no improvement pass.
+    """
+    if ordering == 'nearest':
+        xs = list(xs)
+        ys = list(ys)
+    path = ORDERINGS[ordering](xs, ys, start_index)
+    if not path or (time_budget <= 0 and max_passes <= 0):
+        return path, None, None
+
+    xs = list(xs)
+    ys = list(ys)
+
+    txs = [xs[i] for i in path]
+    tys = [ys[i] for i in path]
+    tour = list(range(len(path)))
+    before = tour_length(txs, tys, tour)
+    tour = improve_tour(txs, tys, tour, time_budget=time_budget, max_passes=max_passes)
+    after = tour_length(txs, tys, tour)
+    return [path[i] for i in tour], before, after
@@ -0,0 +1,243 @@
+'''
+repeated hole pattern detection, for subprogram output
+'''
+
+import numpy as np
+from drillcore import HoleGroup
+from drillorder import nearest_neighbor_order, order_tour
+
+
+class HolePattern:
+    """
+    A hole group found to be copies of one pattern at several offsets.
+
+    pattern is a HoleGroup of the holes of the first copy, in drilling
+    order. offsets are the (x, y) shifts of every copy, in drilling order,
+    the first being (0, 0). Both are on the output coordinate grid, so
+    pattern + offset gives back each hole exactly as it would be written.
+    """
+    __slots__ = ('pattern', 'offsets', 'number')
+
+    def __init__(self, pattern, offsets, number=None):
+        self.pattern = pattern
+        self.offsets = offsets
+        # Subprogram number, given out when the program is written
+        self.number = number
+
+    def __len__(self):
+        return len(self.pattern) * len(self.offsets)
+
+    def holes(self):
+        """Every hole, in the order the program drills them."""
+        xs = (self.offsets[:, 0][:, None] + self.pattern.xs[None, :]).ravel()
+        ys = (self.offsets[:, 1][:, None] + self.pattern.ys[None, :]).ravel()
+        return HoleGroup(self.pattern.d, xs, ys)
+
+
+def written(values, decimals):
+    """
+    Values as integers in units of their last written digit, rounded as
+    the writers round them (rounding value * 10**decimals can differ).
+    """
+    return np.array([int(f"{v:.{decimals}f}".replace('.', '')) for v in np.asarray(values, dtype=float).tolist()],
+        dtype=np.int64)
+
+
+# Neighbouring grid cells, nearest first. Two copies of a hole can be
+# written one digit apart, so while searching, matches are allowed this
+# far off. The copies of a pattern that is used must match exactly.
+NEAR = [(0, 0), (1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (1, -1), (-1, 1), (-1, -1)]
+
+
+class PointSet:
+    """
+    Points on an integer grid, for looking up many shifted points at once.
+
+    Every grid cell next to a point is stored too, pointing back at it (at
+    the nearest point, where two are close, so a point is always found in
+    its own cell), so that finding a point within one grid step takes a
+    single searchsorted.
+    """
+
+    def __init__(self, qx, qy):
+        self.ux = qx - qx.min()
+        self.uy = qy - qy.min()
+        # One cell of margin all round, for the neighbours
+        self.width = int(self.ux.max()) + 3
+        self.height = int(self.uy.max()) + 3
+        near = np.array(NEAR)
+        cx = (self.ux[None, :] + 1 + near[:, 0][:, None]).ravel()
+        cy = (self.uy[None, :] + 1 + near[:, 1][:, None]).ravel()
+        # Rows are in NEAR order, so the first of each key is the nearest point
+        keys = cx * self.height + cy
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        first = np.ones(len(keys), dtype=bool)
+        first[1:] = keys[1:] != keys[:-1]
+        self.keys = keys[first]
+        self.owner = (order % len(self.ux))[first]
+
+    def nearby(self, ux, uy):
+        """Index of a point within one grid step of (ux, uy), or -1."""
+        ux = ux + 1
+        uy = uy + 1
+        inside = (ux >= 0) & (ux < self.width) & (uy >= 0) & (uy < self.height)
+        keys = ux * self.height + uy
+        pos = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        return np.where(inside & (self.keys[pos] == keys), self.owner[pos], -1)
+
+    def contains(self, ux, uy):
+        """Which of the points (ux, uy) have a point within one grid step."""
+        return self.nearby(ux, uy) >= 0
+
+    def at(self, ux, uy):
+        """Index of the point at exactly (ux, uy), or -1."""
+        i = self.nearby(ux, uy)
+        return np.where((i >= 0) & (self.ux[i] == ux) & (self.uy[i] == uy), i, -1)
+
+
+def find_pattern(xs, ys, decimals, neighbours=4, max_candidates=128, max_steps=12,
+        max_copies=1000, sample_size=2000):
+    """
+    Try to write the holes as copies of one pattern at a grid of offsets,
+    i.e. holes = pattern + {i*a + j*b}.
+
+    Coordinates are taken as they would be written, to decimals places.
+    While searching, a hole counts as a copy of another if it is within
+    one digit of it. The pattern is the copy holding the first hole in
+    x-then-y order, so every offset is a vector from that hole to another.
+    Candidates are the vectors that also carry its nearest neighbours onto
+    holes, and the grid steps a and b are the candidates that carry at
+    least half of all holes onto holes. Every grid of them is checked in
+    full: the pattern shifted by each offset must land exactly on every
+    hole, once and only once, so the program drills what it would have
+    without the pattern.
+
+    Returns (pattern indices, integer offsets) for the decomposition that
+    saves the most lines, or None if there is none.
+    """
+    n = len(xs)
+    if n < 4:
+        return None
+    points = PointSet(written(xs, decimals), written(ys, decimals))
+    ux = points.ux
+    uy = points.uy
+
+    first = int(np.lexsort((uy, ux))[0])
+    dx = ux - ux[first]
+    dy = uy - uy[first]
+    candidate = np.ones(n, dtype=bool)
+    candidate[first] = False
+
+    # Vectors that carry the first hole's neighbours onto holes too
+    dist = np.hypot(dx, dy)
+    k = min(neighbours, n - 1)
+    near = np.argpartition(dist, k)[:k + 1]
+    for q in near.tolist():
+        if q != first:
+            candidate &= points.contains(ux[q] + dx, uy[q] + dy)
+    cand = np.nonzero(candidate)[0]
+    cand = cand[np.argsort(dist[cand], kind="stable")][:max_candidates]
+
+    # Grid steps carry at least half of the holes onto holes. A sample of
+    # holes is enough to tell, as every grid is checked in full below.
+    sample = np.arange(n)
+    if n > sample_size:
+        sample = np.random.default_rng(0).choice(n, sample_size, replace=False)
+    steps = []
+    for c in cand.tolist():
+        hits = int(points.contains(ux[sample] + dx[c], uy[sample] + dy[c]).sum())
+        if hits >= 0.45 * len(sample):
+            steps.append((hits, c))
+    steps.sort(key=lambda step: -step[0])
+    steps = [(int(dx[c]), int(dy[c])) for (_, c) in steps[:max_steps]]
+    if not steps:
+        return None
+
+    def run(a):
+        """
+        Offsets of the copies along a, from 0, stepping from hole to hole
+        so that rounding doesn't add up over a long run.
+        """
+        offsets = [(0, 0)]
+        while len(offsets) <= max_copies:
+            (x, y) = offsets[-1]
+            i = points.nearby(np.array([ux[first] + x + a[0]]), np.array([uy[first] + y + a[1]]))[0]
+            if i < 0:
+                break
+            offsets.append((int(dx[i]), int(dy[i])))
+        return np.array(offsets)
+
+    def saving(copies):
+        """Lines saved: the pattern is written once, then a shift, a hole and a call per copy."""
+        return n - (n // copies + 3 * copies)
+
+    # Grids of copies, as the runs of offsets along a and along b
+    runs = [run(a) for a in steps]
+    grids = [(along, np.zeros((1, 2), dtype=np.int64)) for along in runs]
+    for s in range(len(steps)):
+        for t in range(s + 1, len(steps)):
+            (a, b) = (steps[s], steps[t])
+            if a[0] * b[1] != a[1] * b[0]:
+                grids.append((runs[s], runs[t]))
+    grids = [(along_a, along_b) for (along_a, along_b) in grids
+        if len(along_a) * len(along_b) <= max_copies and n % (len(along_a) * len(along_b)) == 0
+        and saving(len(along_a) * len(along_b)) > 0]
+    grids.sort(key=lambda grid: -saving(len(grid[0]) * len(grid[1])))
+
+    best = None
+    for (along_a, along_b) in grids:
+        copies = len(along_a) * len(along_b)
+        if best is not None and saving(copies) <= best[0]:
+            break
+        # Each copy's offset is that of the hole nearest to where its first hole should be
+        grid_x = (along_a[None, :, 0] + along_b[:, None, 0]).ravel()
+        grid_y = (along_a[None, :, 1] + along_b[:, None, 1]).ravel()
+        corner = points.nearby(ux[first] + grid_x, uy[first] + grid_y)
+        if (corner < 0).any():
+            continue
+        offsets = np.column_stack((dx[corner], dy[corner]))
+        # A quick look first: the first hole and its neighbours must be in every copy
+        if not points.contains((ux[near][:, None] + offsets[:, 0]).ravel(),
+                (uy[near][:, None] + offsets[:, 1]).ravel()).all():
+            continue
+        # The first copy is whatever isn't a shifted copy of something else
+        in_pattern = np.ones(n, dtype=bool)
+        for (ox, oy) in offsets[1:].tolist():
+            in_pattern &= ~points.contains(ux - ox, uy - oy)
+            if in_pattern.sum() * copies < n:
+                break
+        pattern = np.nonzero(in_pattern)[0]
+        if len(pattern) * copies != n:
+            continue
+        shifted_x = (ux[pattern][None, :] + offsets[:, 0][:, None]).ravel()
+        shifted_y = (uy[pattern][None, :] + offsets[:, 1][:, None]).ravel()
+        # ...and the shifted copies must land exactly on every hole once
+        found = points.at(shifted_x, shifted_y)
+        if (found < 0).any() or len(np.unique(found)) != n:
+            continue
+        best = (saving(copies), pattern, offsets)
+
+    if best is None:
+        return None
+    return best[1], best[2]
+
+
+def hole_pattern(group, decimals, time_budget=0.0, max_passes=0, ordering='nearest'):
+    """
+    The group as a HolePattern ready to drill, or None if it has no
+    repeats worth a subprogram. The pattern's holes are ordered like any
+    other tour, and the copies nearest neighbour first, from the copy
+    at (0, 0).
+    """
+    found = find_pattern(group.xs, group.ys, decimals)
+    if found is None:
+        return None
+    (members, offsets) = found
+    scale = 10.0 ** decimals
+    xs = written(group.xs[members], decimals) / scale
+    ys = written(group.ys[members], decimals) / scale
+    (path, _, _) = order_tour(xs, ys, 0, time_budget, max_passes, ordering)
+    offsets = offsets / scale
+    order = nearest_neighbor_order(offsets[:, 0].tolist(), offsets[:, 1].tolist(), 0)
+    return HolePattern(HoleGroup(group.d, xs[path], ys[path]), offsets[order])
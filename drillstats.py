@@ -0,0 +1,93 @@
+'''
+job statistics for the drill exporters
+'''
+
+import contextlib
+import json
+import time
+import numpy as np
+
+
+class JobStats:
+    """
+    What one export did and where its time went: wall time per stage,
+    elements visited and circles found, holes per diameter, and for the
+    G-code exporter every tour with its tool and rapid travel.
+
+    Stage times are always kept, as they cost nothing. The rest is only
+    filled in when the exporter's --stats option is on.
+    """
+
+    def __init__(self, unit=None):
+        self.unit = unit
+        self.stages = {}
+        self.elements = 0
+        self.circles = 0
+        # Clones expanded, and clones the streaming reader had to skip
+        self.clones = 0
+        self.skipped_clones = 0
+        self.holes = {}
+        # Size -> the drawn diameters clustered into it
+        self.merged = {}
+        # Holes removed as duplicates, and holes found inside larger ones
+        self.duplicates = 0
+        self.inside = 0
+        self.tours = []
+        # Tours drilled as copies of one pattern, by subprogram
+        self.patterns = []
+        self.outputs = []
+        # Output file -> cycle time estimate, if one was asked for
+        self.estimates = {}
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Time a `with` block, adding to the stage's total."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+    def add_groups(self, circle_groups):
+        self.holes = {d: len(group) for (d, group) in circle_groups.items()}
+        self.merged = dict(circle_groups.merged)
+
+    def add_tour(self, tool, d, group):
+        """One tool's pass over a hole group, in the order it is drilled."""
+        rapid = float(np.hypot(np.diff(group.xs), np.diff(group.ys)).sum())
+        self.tours.append(dict(tool=tool, diameter=d, holes=len(group), rapid=round(rapid, 6)))
+
+    def tool_changes(self):
+        return len(self.tours)
+
+    def rapid(self):
+        return sum(tour['rapid'] for tour in self.tours)
+
+    def report(self):
+        return dict(unit=self.unit,
+            stages={name: round(t, 6) for (name, t) in self.stages.items()},
+            seconds=round(sum(self.stages.values()), 6),
+            elements_visited=self.elements, circles_found=self.circles,
+            clones=self.clones, skipped_clones=self.skipped_clones,
+            holes=sum(self.holes.values()), holes_per_diameter=self.holes,
+            merged_diameters=self.merged,
+            duplicates_removed=self.duplicates, holes_inside_larger=self.inside,
+            tool_changes=self.tool_changes(), rapid_total=round(self.rapid(), 6),
+            tours=self.tours, patterns=self.patterns, outputs=self.outputs, estimates=self.estimates)
+
+    def save(self, path):
+        with open(path, "w") as statsfile:
+            json.dump(self.report(), statsfile, indent=1)
+
+    def summary(self):
+        """A few lines for inkex.utils.errormsg."""
+        lines = [f"{sum(self.holes.values())} holes in {len(self.holes)} sizes, "
+            f"from {self.circles} circles in {self.elements} elements"]
+        if self.duplicates or self.inside:
+            lines.append(f"{self.duplicates} duplicates removed, {self.inside} holes inside larger ones")
+        if self.tours:
+            lines.append(f"{self.tool_changes()} tool changes, "
+                f"{self.rapid():.4f}{self.unit} rapid travel between holes")
+        lines.append("Time: " + ", ".join(f"{name} {t:.3f}s" for (name, t) in self.stages.items())
+            + f" (total {sum(self.stages.values()):.3f}s)")
+        return "\n".join(lines)
@@ -0,0 +1,88 @@
+'''
+streaming SVG input for the drill exporters
+'''
+
+import io
+import inkex
+from lxml import etree
+
+SVG_CIRCLE = inkex.addNS('circle', 'svg')
+SVG_USE = inkex.addNS('use', 'svg')
+# Only drawn through clones
+SVG_TEMPLATES = (inkex.addNS('defs', 'svg'), inkex.addNS('symbol', 'svg'))
+
+
+def root_document(root):
+    """An inkex document holding a childless copy of the root element."""
+    bare = etree.Element(root.tag, attrib=dict(root.attrib), nsmap=root.nsmap)
+    return inkex.load_svg(io.BytesIO(etree.tostring(bare)))
+
+
+def iter_circles(source, stats=None):
+    """
+    Stream an SVG file with lxml iterparse.
+
+    Yields a root-only inkex document first, then (matrix, cx, cy, r, id)
+    for every svg:circle in document order, where matrix is the circle's
+    composed transform. The transform stack is pushed and popped as elements
+    open and close, and each subtree is freed once it has been processed.
+    Circles in <defs> and <symbol> are left out. Clones can't be expanded,
+    as what they point at may already be freed, so they are only counted.
+    Elements and clones are counted in stats, if given.
+    """
+    stack = []
+    hidden = 0
+    context = etree.iterparse(source, events=("start", "end"),
+        remove_comments=True, huge_tree=True)
+    for event, elem in context:
+        if event == "start":
+            parent = stack[-1] if stack else inkex.Transform()
+            stack.append(parent @ inkex.Transform(elem.get('transform')))
+            if elem.tag in SVG_TEMPLATES:
+                hidden += 1
+            if len(stack) == 1:
+                yield root_document(elem)
+            continue
+
+        matrix = stack.pop()
+        if stats is not None:
+            stats.elements += 1
+        if elem.tag in SVG_TEMPLATES:
+            hidden -= 1
+        elif not hidden:
+            if elem.tag == SVG_CIRCLE:
+                yield (matrix, elem.get('cx', 0), elem.get('cy', 0), elem.get('r', 0), elem.get('id'))
+            elif elem.tag == SVG_USE and stats is not None:
+                stats.skipped_clones += 1
+        if stack:
+            # Done with this subtree, and with the siblings before it
+            elem.clear()
+            parent = elem.getparent()
+            while elem.getprevious() is not None:
+                del parent[0]
+
+
+class StreamingInput:
+    """
+    Mixin for the drill exporters. With --stream=true the input is read by
+    iter_circles() instead of being loaded into the inkex DOM; the circles go
+    straight into the exporter's batch, and the document left behind only
+    has the root element.
+    """
+
+    def load(self, stream):
+        if self.options.stream != "true":
+            return super().load(stream)
+
+        circles = iter_circles(getattr(stream, 'buffer', stream), self.stats)
+        document = next(circles)
+        # Nothing is changed, so nothing gets written back out
+        self.original_document = document
+        self.svg = document.getroot()
+        self.prepare()
+        for circle in circles:
+            self.batch.add(*circle)
+        if self.stats.skipped_clones:
+            inkex.utils.errormsg(f"{self.stats.skipped_clones} clones were not drilled - "
+                "clones can only be expanded without --stream")
+        return document
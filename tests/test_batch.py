@@ -0,0 +1,60 @@
+'''
+batch export - one bad file doesn't stop the rest
+'''
+
+import csv
+import multiprocessing
+import pytest
+import BatchDrills
+
+SVG = ('<svg xmlns="http://www.w3.org/2000/svg" width="20mm" height="20mm" viewBox="0 0 20 20">'
+    '<circle cx="5" cy="5" r="0.5"/><circle cx="15" cy="5" r="0.5"/></svg>')
+
+# Stands in for an exporter whose worker dies outright, e.g. killed for memory
+CRASHER = '''
+import os
+import ExportDrills
+
+class DrillExport(ExportDrills.DrillExport):
+    def run(self, args):
+        if args[-1].endswith("crash.svg"):
+            os._exit(1)
+        super().run(args)
+'''
+
+
+def summary(path):
+    with open(path, newline="") as rows:
+        return {row['file'].rsplit('/', 1)[-1]: row for row in csv.DictReader(rows)}
+
+
+def test_unparsable_file_fails(tmp_path):
+    (tmp_path / "good.svg").write_text(SVG)
+    (tmp_path / "broken.svg").write_text('<svg not xml')
+    BatchDrills.main(["--exporter=csv", f"--outdir={tmp_path / 'out'}", "--jobs=1",
+        f"--summary={tmp_path / 'summary.csv'}", str(tmp_path / "good.svg"), str(tmp_path / "broken.svg")])
+    rows = summary(tmp_path / "summary.csv")
+    assert rows['good.svg']['status'] == 'ok'
+    assert rows['good.svg']['holes'] == '2'
+    assert rows['broken.svg']['status'] == 'failed'
+
+
+@pytest.mark.skipif(multiprocessing.get_start_method() != 'fork',
+    reason="the stand-in exporter is only seen by forked workers")
+def test_dead_worker_fails_only_its_file(tmp_path, monkeypatch):
+    (tmp_path / "crashexport.py").write_text(CRASHER)
+    monkeypatch.syspath_prepend(str(tmp_path))
+    monkeypatch.setitem(BatchDrills.EXPORTERS, 'crash', ('crashexport', 'csvfile', '.csv'))
+    names = ["a.svg", "crash.svg", "b.svg", "c.svg"]
+    for name in names:
+        (tmp_path / name).write_text(SVG)
+    status = BatchDrills.main(["--exporter=crash", f"--outdir={tmp_path / 'out'}", "--jobs=2",
+        f"--summary={tmp_path / 'summary.csv'}"] + [str(tmp_path / name) for name in names])
+    rows = summary(tmp_path / "summary.csv")
+    assert status == 1
+    assert list(rows) == names
+    assert rows['crash.svg']['status'] == 'failed'
+    assert 'BrokenProcessPool' in rows['crash.svg']['message']
+    for name in ["a.svg", "b.svg", "c.svg"]:
+        assert rows[name]['status'] == 'ok'
+        assert (tmp_path / "out" / name.replace(".svg", ".csv")).exists()
@@ -0,0 +1,77 @@
+'''
+handing exports to a running DrillServer, or running them here
+'''
+
+import os
+import socket
+import threading
+import pytest
+import drillclient
+
+pytestmark = pytest.mark.skipif(not drillclient.SUPPORTED, reason="no Unix sockets here")
+
+
+def serve_once(path, reply):
+    """A stand-in server that answers one job with reply, then stops."""
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    server.listen()
+
+    def answer():
+        (conn, _) = server.accept()
+        with conn:
+            conn.makefile('rb').readline()
+            try:
+                conn.sendall(reply)
+            except OSError:
+                # e.g. only checked for, and never sent a job
+                pass
+        server.close()
+    thread = threading.Thread(target=answer)
+    thread.start()
+    return thread
+
+
+def temp_documents():
+    return {name for name in os.listdir(drillclient.tempfile.gettempdir()) if name.endswith('.svg')}
+
+
+def test_no_server(tmp_path, monkeypatch):
+    monkeypatch.setenv('DRILL_SERVER', str(tmp_path / "none.sock"))
+    assert drillclient.forward('csv', ['in.svg']) is None
+
+
+def test_without_unix_sockets(tmp_path, monkeypatch):
+    path = str(tmp_path / "drills.sock")
+    monkeypatch.setenv('DRILL_SERVER', path)
+    thread = serve_once(path, b'{"status": 0, "messages": ""}\n')
+    monkeypatch.setattr(drillclient, 'SUPPORTED', False)
+    monkeypatch.delattr(os, 'getuid')
+    monkeypatch.delenv('DRILL_SERVER')
+    monkeypatch.delenv('XDG_RUNTIME_DIR', raising=False)
+    assert drillclient.socket_path().endswith("inkscape-drills.sock")
+    assert drillclient.forward('csv', ['in.svg']) is None
+    # Let the stand-in server go
+    monkeypatch.undo()
+    drillclient.connect(path).close()
+    thread.join()
+
+
+@pytest.mark.parametrize("reply", [b"", b'{"status": 0, "mess', b"[]"])
+def test_server_stops_before_replying(tmp_path, monkeypatch, reply):
+    path = str(tmp_path / "drills.sock")
+    monkeypatch.setenv('DRILL_SERVER', path)
+    thread = serve_once(path, reply)
+    before = temp_documents()
+    assert drillclient.forward('csv', ['in.svg']) is None
+    thread.join()
+    assert temp_documents() == before
+
+
+def test_reply(tmp_path, monkeypatch, capsys):
+    path = str(tmp_path / "drills.sock")
+    monkeypatch.setenv('DRILL_SERVER', path)
+    thread = serve_once(path, b'{"status": 3, "messages": "from the server\\n"}\n')
+    assert drillclient.forward('csv', ['--output=out.svg', 'in.svg']) == 3
+    thread.join()
+    assert capsys.readouterr().err == "from the server\n"
@@ -0,0 +1,54 @@
+'''
+clones and symbols, expanded into the holes they draw
+'''
+
+import pytest
+from ExportDrills import DrillExport
+
+
+def exported(tmp_path, body):
+    """Export a 100mm document with the given content, and return its CSV rows."""
+    svgfile = tmp_path / "clones.svg"
+    svgfile.write_text('<svg xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink" '
+        f'width="100mm" height="100mm" viewBox="0 0 100 100">{body}</svg>')
+    csvfile = tmp_path / "clones.csv"
+    DrillExport().run([f"--csvfile={csvfile}", "--unit=mm", "--flipy=false", "--separatedrills=false",
+        "--output=/dev/null", str(svgfile)])
+    return sorted(csvfile.read_text().splitlines()[1:])
+
+
+def test_clone_of_a_group(tmp_path):
+    rows = exported(tmp_path, '<g id="g" transform="translate(1,2)"><circle cx="5" cy="5" r="0.5"/></g>'
+        '<use xlink:href="#g" x="10"/><use xlink:href="#g" transform="translate(0,20)"/>')
+    assert rows == ["1.00,16.00,7.00", "1.00,6.00,27.00", "1.00,6.00,7.00"]
+
+
+def test_clone_of_a_clone(tmp_path):
+    rows = exported(tmp_path, '<defs><circle id="c" cx="5" cy="5" r="0.5"/></defs>'
+        '<use id="u" xlink:href="#c" x="10"/><use xlink:href="#u" y="10"/>')
+    assert rows == ["1.00,15.00,15.00", "1.00,15.00,5.00"]
+
+
+@pytest.mark.parametrize("symbol, use, row", [
+    # The viewBox is scaled into the clone's width and height
+    ('viewBox="0 0 10 10"', 'width="20" height="20"', "4.00,10.00,10.00"),
+    ('viewBox="0 0 10 10"', 'x="30" y="40" width="5" height="5"', "1.00,32.50,42.50"),
+    # Centred in a viewport of another shape, or aligned as asked
+    ('viewBox="0 0 10 10"', 'width="40" height="20"', "4.00,20.00,10.00"),
+    ('viewBox="0 0 10 10" preserveAspectRatio="xMinYMax"', 'width="40" height="20"', "4.00,10.00,10.00"),
+    ('viewBox="0 0 10 10" preserveAspectRatio="xMidYMid slice"', 'width="40" height="20"', "8.00,20.00,10.00"),
+    # The symbol's own size, when the clone has none
+    ('viewBox="0 0 10 10" width="30" height="30"', '', "6.00,15.00,15.00"),
+    # No viewBox, no scaling
+    ('', 'width="20" height="20"', "2.00,5.00,5.00"),
+])
+def test_symbol_viewport(tmp_path, symbol, use, row):
+    rows = exported(tmp_path, f'<defs><symbol id="s" {symbol}><circle cx="5" cy="5" r="1"/></symbol></defs>'
+        f'<use xlink:href="#s" {use}/>')
+    assert rows == [row]
+
+
+def test_symbol_with_empty_viewbox_draws_nothing(tmp_path):
+    rows = exported(tmp_path, '<symbol id="s" viewBox="0 0 0 10"><circle cx="5" cy="5" r="1"/></symbol>'
+        '<use xlink:href="#s" width="20" height="20"/><circle cx="50" cy="50" r="1"/>')
+    assert rows == ["2.00,50.00,50.00"]
@@ -0,0 +1,58 @@
+'''
+duplicate and overlapping hole detection
+'''
+
+import time
+import numpy as np
+import pytest
+from drilldedupe import find_duplicates
+
+
+def brute_force(xs, ys, ds, tolerance):
+    """(dropped holes, holes inside others), checking every pair."""
+    n = len(xs)
+    index = np.arange(n)
+    dist = np.hypot(xs[:, None] - xs[None, :], ys[:, None] - ys[None, :])
+    # kept[i, j]: j would be kept over i
+    kept = (ds[None, :] > ds[:, None]) | ((ds[None, :] == ds[:, None]) & (index[None, :] < index[:, None]))
+    dropped = ((dist <= tolerance) & kept).any(axis=1)
+    held = ((ds[:, None] < ds[None, :]) & (dist > tolerance)
+        & (dist + ds[:, None] / 2 <= ds[None, :] / 2 + tolerance) & ~dropped[None, :]).any(axis=1)
+    return set(np.nonzero(dropped)[0].tolist()), set(np.nonzero(held & ~dropped)[0].tolist())
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_matches_every_pair(seed):
+    rng = np.random.default_rng(seed)
+    n = 1000
+    xs = rng.uniform(0, 40, n).round(1)
+    ys = rng.uniform(0, 30, n).round(1)
+    ds = rng.choice([0.8, 1.0, 3.2, 6.0, 12.0], n, p=[0.5, 0.3, 0.1, 0.07, 0.03])
+    # Some exact and some near copies
+    xs[:20] = xs[20:40]
+    ys[:20] = ys[20:40] + 0.02
+    duplicates, inside = find_duplicates(xs, ys, ds, 0.05)
+    dropped, held = brute_force(xs, ys, ds, 0.05)
+    assert set(duplicates[:, 0].tolist()) == dropped
+    assert set(inside[:, 0].tolist()) == held
+    for (i, j) in inside.tolist():
+        assert np.hypot(xs[i] - xs[j], ys[i] - ys[j]) + ds[i] / 2 <= ds[j] / 2 + 0.05
+
+
+def test_one_large_hole_among_many():
+    # One 60mm hole on a 200 x 200 board of 0.8mm holes at 1mm pitch
+    grid = np.arange(200, dtype=float)
+    xs, ys = (a.ravel() for a in np.meshgrid(grid, grid))
+    ds = np.full(len(xs), 0.8)
+    xs = np.append(xs, 100.5)
+    ys = np.append(ys, 100.5)
+    ds = np.append(ds, 60.0)
+    start = time.perf_counter()
+    duplicates, inside = find_duplicates(xs, ys, ds, 0.01)
+    # Each small hole is only compared with its neighbours and the large hole
+    assert time.perf_counter() - start < 5
+    assert len(duplicates) == 0
+    large = len(xs) - 1
+    expected = np.hypot(xs[:-1] - 100.5, ys[:-1] - 100.5) + 0.4 <= 30.01
+    assert sorted(inside[:, 0].tolist()) == np.nonzero(expected)[0].tolist()
+    assert set(inside[:, 1].tolist()) == {large}
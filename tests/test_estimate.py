@@ -0,0 +1,34 @@
+'''
+cycle time estimates of programs the G-code exporter writes
+'''
+
+import os
+from drillestimate import CycleEstimate
+from ExportGCodeDrills import DrillExport
+
+BOARD = """<svg xmlns="http://www.w3.org/2000/svg" width="40mm" height="30mm" viewBox="0 0 40 30">
+<circle cx="5" cy="5" r="0.5"/><circle cx="15" cy="5" r="0.5"/><circle cx="25" cy="12" r="0.5"/>
+<circle cx="8" cy="20" r="0.8"/><circle cx="30" cy="25" r="0.8"/>
+</svg>"""
+
+
+def export(tmp_path, *options):
+    """Export BOARD, and return the program's text."""
+    svgfile = tmp_path / "board.svg"
+    svgfile.write_text(BOARD)
+    ncfile = tmp_path / "board.nc"
+    DrillExport().run([f"--filename={ncfile}", "--unit=mm", "--zclear=2", "--zstart=0",
+        "--zend=-3", *options, f"--output={os.devnull}", str(svgfile)])
+    return ncfile.read_text()
+
+
+def test_peck_depth_is_written_as_q(tmp_path):
+    program = export(tmp_path, "--peck=0.5")
+    assert "G83 Z-3.0000 R2.0000 Q0.5000" in program
+
+
+def test_pecking_estimates_longer_than_drilling(tmp_path):
+    drilled = CycleEstimate().run(export(tmp_path, "--peck=0").splitlines())
+    pecked = CycleEstimate().run(export(tmp_path, "--peck=0.5").splitlines())
+    assert pecked.holes == drilled.holes == 5
+    assert pecked.total() > drilled.total()
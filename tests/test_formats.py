@@ -0,0 +1,18 @@
+'''
+Excellon drill files
+'''
+
+from drillcore import HoleGroup
+from drillformats import excellon_text
+
+
+def test_excellon_rounds_as_the_csv_does():
+    # 0.00015 is stored a shade under, so is written 0.0001 - but 0.00015 * 10000 is exactly 1.5
+    xs = [0.00015, 1.23455, 2.5, -0.00015]
+    ys = [0.0, 0.00025, 10.00005, 3.0]
+    text = excellon_text({"0.0400": HoleGroup("0.0400", xs, ys)}, "in")
+    holes = [line for line in text.splitlines() if line.startswith("X")]
+    expected = [f"X{int(f'{x:.4f}'.replace('.', ''))}Y{int(f'{y:.4f}'.replace('.', ''))}"
+        for (x, y) in zip(xs, ys)]
+    assert holes == expected
+    assert holes[0] == "X1Y0"
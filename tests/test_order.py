@@ -0,0 +1,30 @@
+'''
+hole ordering and tour improvement
+'''
+
+import random
+from drillorder import improve_tour, nearest_neighbor_order, tour_length
+
+
+def holes(n, seed=3):
+    rng = random.Random(seed)
+    return ([rng.uniform(0, 100) for _ in range(n)], [rng.uniform(0, 100) for _ in range(n)])
+
+
+def test_improve_tour_shortens_and_keeps_the_first_hole():
+    (xs, ys) = holes(2000)
+    path = nearest_neighbor_order(xs, ys, 5)
+    improved = improve_tour(xs, ys, path, max_passes=1)
+    assert improved[0] == 5
+    assert sorted(improved) == list(range(2000))
+    # One pass is worth several percent over nearest neighbor
+    assert tour_length(xs, ys, improved) < 0.95 * tour_length(xs, ys, path)
+
+
+def test_improve_tour_on_tiny_tours():
+    for n in range(1, 12):
+        (xs, ys) = holes(n, seed=n)
+        path = list(range(n))
+        improved = improve_tour(xs, ys, path, max_passes=3)
+        assert sorted(improved) == path and improved[:1] == path[:1]
+        assert tour_length(xs, ys, improved) <= tour_length(xs, ys, path) + 1e-9
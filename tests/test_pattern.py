@@ -0,0 +1,56 @@
+'''
+repeated hole patterns, drilled through subprograms
+'''
+
+import os
+import random
+import pytest
+from drillestimate import CycleEstimate
+from ExportGCodeDrills import DrillExport
+
+
+def panel(pitch_x, pitch_y, columns=4, rows=3, holes=24, seed=1):
+    """An SVG of columns x rows copies of one board, placed by translates."""
+    rng = random.Random(seed)
+    board = "".join(f'<circle cx="{rng.uniform(1, 20):.5f}" cy="{rng.uniform(1, 15):.5f}" '
+        f'r="{rng.choice([0.4, 0.5])}"/>' for _ in range(holes))
+    copies = "".join(f'<g transform="translate({i * pitch_x:.5f},{j * pitch_y:.5f})">{board}</g>'
+        for i in range(columns) for j in range(rows))
+    return ('<svg xmlns="http://www.w3.org/2000/svg" width="120mm" height="80mm" '
+        f'viewBox="0 0 120 80">{copies}</svg>')
+
+
+class Drilled(CycleEstimate):
+    """Runs a program, noting where each hole is drilled, in 0.01mm."""
+
+    def __init__(self):
+        super().__init__()
+        self.drilled = []
+
+    def drill(self):
+        super().drill()
+        self.drilled.append((self.tool, round(self.pos[0] * 100), round(self.pos[1] * 100)))
+
+
+def drilled(tmp_path, svg, *options):
+    """Export svg, and return (program, sorted (tool, x, y) of every hole drilled)."""
+    svgfile = tmp_path / "panel.svg"
+    svgfile.write_text(svg)
+    ncfile = tmp_path / "panel.nc"
+    DrillExport().run([f"--filename={ncfile}", "--unit=mm", "--zclear=2", "--zstart=0",
+        "--zend=-3", "--spottoolno=9", "--spotzend=-0.5", *options, f"--output={os.devnull}",
+        str(svgfile)])
+    program = ncfile.read_text()
+    return program, sorted(Drilled().run(program.splitlines()).drilled)
+
+
+@pytest.mark.parametrize("dialect", ["ngc", "fanuc"])
+@pytest.mark.parametrize("pitch", [(25.0, 20.0), (23.45678, 21.98765)])
+def test_patterns_drill_the_same_holes(tmp_path, dialect, pitch):
+    (_, plain) = drilled(tmp_path, panel(*pitch), "--patterns=false")
+    (program, patterned) = drilled(tmp_path, panel(*pitch), "--patterns=true", f"--dialect={dialect}")
+    assert len(plain) == 2 * 12 * 24
+    assert patterned == plain
+    if pitch == (25.0, 20.0):
+        # Copies an exact number of digits apart are found
+        assert "G52" in program